@@ -32,6 +32,11 @@ try:
     backend_list.append(BackendPNG())
 except ImportError:
     pass
+try:
+    from movie_backend import BackendMovie
+    backend_list.append(BackendMovie())
+except ImportError:
+    pass
 try:
     from pdf_backend import BackendPDF
     backend_list.append(BackendPDF())
@@ -42,5 +47,10 @@ try:
     backend_list.append(BackendTXT())
 except ImportError:
     pass
+try:
+    from npy_backend import BackendNPY
+    backend_list.append(BackendNPY())
+except ImportError:
+    pass
 
 print(__code_name + ' loaded')
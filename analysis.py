@@ -10,6 +10,37 @@ try:
 except NameError:
     pass
 
+import threading
+
+
+# Largest number of cells kept in memory while finding the data range
+max_buffered_cells = 2**24
+
+# Resolution of the base histogram kept for rebinning interactive hist2d zooms
+hist_base_resolution = 2048
+
+# Weightings accumulated together for 2D histograms of cell data
+hist_weightings = ('count', 'volume', 'mass')
+
+# Cancellation of data loads in background threads: a thread sets its
+# cancel_state.event, which the block loops check
+cancel_state = threading.local()
+
+
+class LoadCancelled(Exception):
+    """
+    Raised in a background data load that has been cancelled
+    """
+
+
+def check_cancelled():
+    """
+    Raise LoadCancelled if the data load of this thread has been cancelled
+    """
+    event = getattr(cancel_state, 'event', None)
+    if event is not None and event.is_set():
+        raise LoadCancelled()
+
 
 class analysis_tool():
     def __init__(self, func, properties=None):
@@ -21,6 +52,63 @@ class analysis_tool():
             self.properties = {}
 
 
+class StreamReduction():
+    """
+    Reduction of cell data to a single value (e.g. for time plots). Data is
+    fed one chunk at a time through update(), and result() returns the value,
+    so that memory use is bounded by the chunk size.
+    """
+    def __init__(self, operation, quantile=None):
+        from . import quantile_sketch
+        if operation not in ('mean', 'rms', 'min', 'max', 'sum', 'quantile'):
+            raise ValueError('Unknown reduction {}!'.format(operation))
+        self.operation = operation
+        self.quantile = quantile
+        self.sum_w = 0.0
+        self.sum_wx = 0.0
+        self.sum_wx2 = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+        if operation == 'quantile':
+            self.sketch = quantile_sketch.TDigest()
+        else:
+            self.sketch = None
+
+    def update(self, x, w):
+        import numpy as np
+        if x.size == 0:
+            return
+        operation = self.operation
+        if operation in ('mean', 'rms', 'sum'):
+            self.sum_w += np.sum(w)
+            if operation == 'rms':
+                self.sum_wx2 += np.dot(w, x * x)
+            else:
+                self.sum_wx += np.dot(w, x)
+        elif operation == 'min':
+            self.min = min(self.min, np.min(x))
+        elif operation == 'max':
+            self.max = max(self.max, np.max(x))
+        else:
+            self.sketch.update(x, w)
+
+    def result(self):
+        import numpy as np
+        operation = self.operation
+        if operation == 'mean':
+            return self.sum_wx / self.sum_w if self.sum_w else np.nan
+        elif operation == 'rms':
+            return np.sqrt(self.sum_wx2 / self.sum_w) if self.sum_w else np.nan
+        elif operation == 'sum':
+            return self.sum_wx
+        elif operation == 'min':
+            return self.min
+        elif operation == 'max':
+            return self.max
+        else:
+            return self.sketch.quantile(self.quantile)
+
+
 def bracket_data(value, transform):
     """
     If you have a situation where minimum and maximum are the same,
@@ -43,14 +131,152 @@ def bracket_data(value, transform):
     return minval, maxval
 
 
+def get_xy_limits(draw_limits, min_max_data, x_transform, y_transform):
+    """
+    Find x and y plot limits in the transformed space, from the draw limits
+    and (where these are 'auto') the minimum and maximum of the data
+    """
+    import numpy as np
+
+    xmin, xmax = draw_limits['x_axis']
+    ymin, ymax = draw_limits['y_axis']
+
+    if xmin == 'auto':
+        xmin = min_max_data['x_min']
+    elif x_transform is not None:
+        xmin = x_transform[0](xmin)
+    if xmax == 'auto':
+        xmax = min_max_data['x_max']
+    elif x_transform is not None:
+        xmax = x_transform[0](xmax)
+
+    if (x_transform is not None) and (xmin > xmax):
+        xmin, xmax = xmax, xmin
+
+    if ymin == 'auto':
+        ymin = min_max_data['y_min']
+    elif y_transform is not None:
+        ymin = y_transform[0](ymin)
+    if ymax == 'auto':
+        ymax = min_max_data['y_max']
+    elif y_transform is not None:
+        ymax = y_transform[0](ymax)
+
+    if (y_transform is not None) and (ymin > ymax):
+        ymin, ymax = ymax, ymin
+
+    if np.allclose(xmin, xmax, rtol=1e-20, atol=1e-100):
+        if draw_limits['x_axis'][0] == 'auto':
+            xmin = bracket_data(xmin, x_transform)[0]
+        if draw_limits['x_axis'][1] == 'auto':
+            xmax = bracket_data(xmax, x_transform)[1]
+    if np.allclose(ymin, ymax, rtol=1e-20, atol=1e-100):
+        if draw_limits['y_axis'][0] == 'auto':
+            ymin = bracket_data(ymin, y_transform)[0]
+        if draw_limits['y_axis'][1] == 'auto':
+            ymax = bracket_data(ymax, y_transform)[1]
+
+    return [[xmin, xmax], [ymin, ymax]]
+
+
+def scale_transform_finite(columns, factors, transforms):
+    """
+    Scale (to units) and transform equal-length columns in place, and find
+    the rows where every column is finite, in one pass of cache-sized
+    blocks. Returns the mask of finite rows (None if all rows are finite),
+    the number of finite rows and the [min, max] of each column over them.
+    """
+    from . import histogram
+    import numpy as np
+
+    n = columns[0].shape[0]
+    mask = None
+    n_finite = 0
+    min_max = [[np.inf, -np.inf] for column in columns]
+    for block in histogram.iter_blocks(n):
+        check_cancelled()
+        blocks = [column[block] for column in columns]
+        for values, factor, transform in zip(blocks, factors, transforms):
+            if factor != 1.0:
+                values *= factor
+            if transform is not None:
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    transform[0](values, out=values)
+
+        # Check for invalid data
+        if all(np.isfinite(np.sum(values)) for values in blocks):
+            valid_blocks = blocks
+        else:
+            if mask is None:
+                mask = np.ones(n, dtype=bool)
+            block_mask = mask[block]
+            block_mask[...] = True
+            for values in blocks:
+                finite = np.isfinite(values)
+                if finite.ndim > 1:
+                    finite = finite.reshape(len(values), -1).all(axis=1)
+                block_mask &= finite
+            valid_blocks = [values[block_mask] for values in blocks]
+
+        if len(valid_blocks[0]) == 0:
+            continue
+        n_finite += len(valid_blocks[0])
+        for limits, values in zip(min_max, valid_blocks):
+            limits[0] = min(limits[0], values.min())
+            limits[1] = max(limits[1], values.max())
+
+    return mask, n_finite, min_max
+
+
+def prepare_xy_chunk(data_array, weights, x_fac, y_fac,
+                     x_transform, y_transform):
+    """
+    Scale and transform (in place) one chunk of (x, y) data, and drop
+    points which are not finite. Returns x, y, weights, whether all points
+    were finite and the [min, max] of x and y over the finite points.
+    """
+    x = data_array[:, 0]
+    y = data_array[:, 1]
+
+    mask, n_finite, min_max = scale_transform_finite(
+        [x, y], [x_fac, y_fac], [x_transform, y_transform])
+
+    if mask is None:
+        return x, y, weights, True, min_max
+    return x[mask], y[mask], weights[mask], False, min_max
+
+
 def get_histogram2d(x_field, x_index, x_unit, x_pos,
                     y_field, y_index, y_unit, y_pos,
                     resolution, plot_transforms, draw_limits,
-                    data_limits, step, shared, data_list_pass=None):
+                    data_limits, step, shared, data_list_pass=None,
+                    keep_base=False, base_pass=None,
+                    colour_field=None, colour_index=None, colour_unit=1.0,
+                    statistic='mean'):
     """
     Obtain histogrammed data of arbitrary quantities
+
+    Cell data is streamed one chunk at a time into a fixed-bin histogram.
+    If the bins depend on the data range ('auto' limits), chunks are kept
+    while they fit within max_buffered_cells; beyond that only the range is
+    found on the first pass, and the cells are reread to bin them. Sampled
+    data (position axes) is already in memory, and is binned in one go.
+
+    If keep_base is set, a base histogram of hist_base_resolution bins per
+    axis is also kept (as the fifth item of the data list). When passed back
+    as base_pass, plots within its range and no finer than its bins are
+    rebinned from it rather than rereading the data.
+
+    Cell data is binned with count, volume and mass weights at once; the
+    histogram is kept as the last item of the data list, so that switching
+    the weighting option only needs use_old_data.
+
+    If colour_field is set (cell data only), each bin instead holds a
+    statistic ('mean', 'max' or 'dispersion') of that quantity, accumulated
+    in the same pass as the counts.
     """
     from . import wrapper_functions as wf
+    from . import histogram
     import numpy as np
 
     # Box length and transforms
@@ -58,11 +284,13 @@ def get_histogram2d(x_field, x_index, x_unit, x_pos,
     x_transform = plot_transforms['x_transform']
     y_transform = plot_transforms['y_transform']
     hist_transform = plot_transforms['hist_transform']
+    use_units = (shared.config.get_safe('data', 'use_units') != 'off')
+    weighting = shared.config.get('opts', 'weighting')
 
     if data_list_pass is None:
         # Get data
         if x_pos:
-            if (shared.config.get_safe('data', 'use_units') != 'off'):
+            if use_units:
                 xlim = (np.array(draw_limits['x_axis']) * x_unit *
                         box_length[x_index] / step.length_mks)
             else:
@@ -72,7 +300,7 @@ def get_histogram2d(x_field, x_index, x_unit, x_pos,
             xlim = None
 
         if y_pos:
-            if (shared.config.get_safe('data', 'use_units') != 'off'):
+            if use_units:
                 ylim = (np.array(draw_limits['y_axis']) * y_unit *
                         box_length[y_index] / step.length_mks)
             else:
@@ -80,30 +308,53 @@ def get_histogram2d(x_field, x_index, x_unit, x_pos,
         else:
             ylim = None
 
+        if (x_pos or y_pos) and (colour_field is not None):
+            raise ValueError('Colouring 2D histograms by a quantity needs '
+                             'non-position axes!')
         if x_pos or y_pos:
             data_array, weights, (bins_x, bins_y) = wf.get_sample_data(
                 x_field, x_index, xlim,
                 y_field, y_index, ylim,
                 None, None, resolution, data_limits, step, shared)
+            sampled = True
+            sampled_chunks = [(data_array, weights)]
+            get_chunks = lambda: sampled_chunks
         else:
-            data_array, weights = wf.get_cell_data(
-                x_field, x_index, y_field, y_index, data_limits, step, shared)
+            sampled = False
             bins_x, bins_y = None, None
-
-        # Save to convenient names
-        x = data_array[:, 0]
-        y = data_array[:, 1]
-
-        # Scale to units
-        if shared.config.get_safe('data', 'use_units') != 'off':
+            def get_chunks():
+                if step.data_set is None:
+                    step.load_dataset()
+                if colour_field is None:
+                    return wf.iter_cell_data(x_field, x_index,
+                                             y_field, y_index,
+                                             data_limits, step, shared,
+                                             weighting_columns)
+                return iter_colour_chunks()
+            def iter_colour_chunks():
+                # Count weights, colour weights and colour values are kept
+                # together as the 'weights', so they are masked alike
+                for data_array, weights_list in wf.iter_multi_cell_data(
+                        [x_field, y_field, colour_field],
+                        [x_index, y_index, colour_index],
+                        data_limits, step, shared):
+                    cell_weights = np.column_stack(
+                        (weights_list[1], weights_list[2], data_array[:, 2]))
+                    if colour_fac != 1.0:
+                        cell_weights[:, 2] *= colour_fac
+                    yield data_array[:, :2], cell_weights
+
+        # Unit scaling factors
+        x_fac = 1.0
+        y_fac = 1.0
+        colour_fac = 1.0
+        if use_units:
             if x_field is not None:
-                x_units = x_field.code_mks / x_unit
-                if x_units != 1.0:
-                    x[:] = x * x_units
+                x_fac = x_field.code_mks / x_unit
             if y_field is not None:
-                y_units = y_field.code_mks / y_unit
-                if y_units != 1.0:
-                    y[:] = y * y_units
+                y_fac = y_field.code_mks / y_unit
+            if colour_field is not None:
+                colour_fac = colour_field.code_mks / colour_unit
             if bins_x is not None:
                 bins_x = bins_x * step.length_mks / x_unit
             if bins_y is not None:
@@ -114,98 +365,207 @@ def get_histogram2d(x_field, x_index, x_unit, x_pos,
             if bins_y is not None:
                 bins_y = bins_y * box_length[y_index]
 
-        # Perform transform
-        if (not x_pos) and (x_transform is not None):
-            x[:] = x_transform[0](x)
-        if (not y_pos) and (y_transform is not None):
-            y[:] = y_transform[0](y)
+        # Transforms are not applied to position axes
+        x_chunk_transform = None if x_pos else x_transform
+        y_chunk_transform = None if y_pos else y_transform
 
-        # Check for invalid data
-        if (not np.isfinite(np.sum(x))) or (not np.isfinite(np.sum(y))):
+        # All weightings are accumulated together for counts of cell data,
+        # so that the weighting can be switched without rereading
+        if not sampled and colour_field is None:
+            weightings = hist_weightings
+        else:
+            weightings = None
+        # ('count' needs no weights column)
+        weighting_columns = [name for name in hist_weightings
+                             if name != 'count']
+
+        # Base histograms are only kept for counts of cell data
+        keep_base = keep_base and weightings is not None
+        if keep_base:
+            # Only the forward transforms affect the binned data
+            base_key = (step.output_dir,
+                        x_field.name, x_index, x_unit,
+                        None if x_transform is None else x_transform[0],
+                        y_field.name, y_index, y_unit,
+                        None if y_transform is None else y_transform[0],
+                        repr(data_limits), use_units)
+        if keep_base and (base_pass is not None) and \
+                (base_pass['key'] == base_key):
+            # Rebin from the base histogram, if it is fine enough
+            min_max_data = base_pass['min_max_data']
+            xy_limits = get_xy_limits(draw_limits, min_max_data,
+                                      x_transform, y_transform)
+            hist = new_histogram2d(None, None, xy_limits, resolution)
+            base_hist = base_pass['hist']
+            if base_hist.covers(hist.xedges, hist.yedges):
+                hist = base_hist.rebin(hist.xedges, hist.yedges)
+                hist.select(weighting)
+                counts = transform_histogram(hist.counts, hist_transform)
+                return ([hist.xedges, hist.yedges, counts, min_max_data,
+                         base_pass, hist], xy_limits)
+
+        def add_chunk(hist, x, y, weights):
+            if colour_field is None:
+                hist.add(x, y, weights)
+            else:
+                hist.add(x, y, weights[:, 0], weights[:, 2], weights[:, 1])
+
+        # Do we need the range of the data before we can bin it?
+        need_range = ((not x_pos and 'auto' in draw_limits['x_axis']) or
+                      (not y_pos and 'auto' in draw_limits['y_axis']))
+
+        hist = None
+        base_hist = None
+        if not need_range:
+            xy_limits = get_xy_limits(draw_limits, None,
+                                      x_transform, y_transform)
+            hist = new_histogram2d(bins_x, bins_y, xy_limits, resolution,
+                                   colour_field is not None, weightings)
+            if keep_base:
+                base_hist = new_histogram2d(None, None, xy_limits,
+                                            hist_base_resolution,
+                                            weightings=weightings)
+
+        # First pass over chunks: find range, and bin if possible
+        x_min, x_max = np.inf, -np.inf
+        y_min, y_max = np.inf, -np.inf
+        n_valid = 0
+        all_finite = True
+        buffered_chunks = []
+        n_buffered = 0
+        for data_array, weights in get_chunks():
+            x, y, weights, chunk_finite, min_max = prepare_xy_chunk(
+                data_array, weights, x_fac, y_fac,
+                x_chunk_transform, y_chunk_transform)
+            all_finite = all_finite and chunk_finite
+            if x.size == 0:
+                continue
+            n_valid += x.size
+            x_min = min(x_min, min_max[0][0])
+            x_max = max(x_max, min_max[0][1])
+            y_min = min(y_min, min_max[1][0])
+            y_max = max(y_max, min_max[1][1])
+            if hist is not None:
+                add_chunk(hist, x, y, weights)
+                if base_hist is not None:
+                    base_hist.add(x, y, weights)
+            elif buffered_chunks is not None:
+                n_buffered += x.size
+                if n_buffered > max_buffered_cells and not sampled:
+                    # Too many to keep: bin on a second pass instead
+                    buffered_chunks = None
+                else:
+                    buffered_chunks.append((x, y, weights))
+            del data_array, x, y, weights
+
+        if not all_finite:
             print('Warning - invalidly transformed data skipped!')
-            x_mask = np.isfinite(x)
-            y_mask = np.isfinite(y)
-            mask_values = np.logical_and(x_mask, y_mask)
-            if not np.any(mask_values):
-                raise ValueError('No valid values remaining!')
-            x = x[mask_values]
-            y = y[mask_values]
-            weights = weights[mask_values]
+        if n_valid == 0:
+            raise ValueError('No valid values remaining!')
 
         min_max_data = {}
-        min_max_data['x_min'] = x.min()
-        min_max_data['x_max'] = x.max()
-        min_max_data['y_min'] = y.min()
-        min_max_data['y_max'] = y.max()
+        min_max_data['x_min'] = x_min
+        min_max_data['x_max'] = x_max
+        min_max_data['y_min'] = y_min
+        min_max_data['y_max'] = y_max
+
+        if hist is None:
+            xy_limits = get_xy_limits(draw_limits, min_max_data,
+                                      x_transform, y_transform)
+            hist = new_histogram2d(bins_x, bins_y, xy_limits, resolution,
+                                   colour_field is not None, weightings)
+            if keep_base:
+                # Cover both the data and the plot range
+                data_xy_limits = get_xy_limits(
+                    {'x_axis': ['auto', 'auto'], 'y_axis': ['auto', 'auto']},
+                    min_max_data, x_transform, y_transform)
+                base_xy_limits = [
+                    [min(xy_limits[i][0], data_xy_limits[i][0]),
+                     max(xy_limits[i][1], data_xy_limits[i][1])]
+                    for i in range(2)]
+                base_hist = new_histogram2d(None, None, base_xy_limits,
+                                            hist_base_resolution,
+                                            weightings=weightings)
+            if buffered_chunks is not None:
+                for x, y, weights in buffered_chunks:
+                    add_chunk(hist, x, y, weights)
+                    if base_hist is not None:
+                        base_hist.add(x, y, weights)
+                buffered_chunks = None
+            else:
+                print('Rereading data to bin...')
+                for data_array, weights in get_chunks():
+                    x, y, weights = prepare_xy_chunk(
+                        data_array, weights, x_fac, y_fac,
+                        x_chunk_transform, y_chunk_transform)[:3]
+                    add_chunk(hist, x, y, weights)
+                    if base_hist is not None:
+                        base_hist.add(x, y, weights)
+                    del data_array, x, y, weights
+
+        xedges = hist.xedges
+        yedges = hist.yedges
+        if weightings is not None:
+            hist.select(weighting)
+        if colour_field is None:
+            counts = transform_histogram(hist.counts, hist_transform)
+        else:
+            counts = transform_histogram(hist.statistic(statistic),
+                                         hist_transform)
+
+        if base_hist is not None:
+            base_pass = {'key': base_key, 'hist': base_hist,
+                         'min_max_data': min_max_data}
+        else:
+            base_pass = None
 
     else:
         # Use old data
-        xedges, yedges, counts, min_max_data = data_list_pass
+        xedges, yedges, counts, min_max_data, base_pass, hist = \
+            data_list_pass
+        if isinstance(hist, histogram.MultiWeightHistogram2D):
+            # The weighting may have been switched
+            hist.select(weighting)
+            counts = transform_histogram(hist.counts, hist_transform)
 
-    # Plot limits
-    xmin, xmax = draw_limits['x_axis']
-    ymin, ymax = draw_limits['y_axis']
+        # Plot limits
+        xy_limits = get_xy_limits(draw_limits, min_max_data,
+                                  x_transform, y_transform)
 
-    if xmin == 'auto':
-        xmin = min_max_data['x_min']
-    elif x_transform is not None:
-        xmin = x_transform[0](xmin)
-    if xmax == 'auto':
-        xmax = min_max_data['x_max']
-    elif x_transform is not None:
-        xmax = x_transform[0](xmax)
+    return [xedges, yedges, counts, min_max_data, base_pass, hist], xy_limits
 
-    if (x_transform is not None) and (xmin > xmax):
-        xmin, xmax = xmax, xmin
 
-    if ymin == 'auto':
-        ymin = min_max_data['y_min']
-    elif y_transform is not None:
-        ymin = y_transform[0](ymin)
-    if ymax == 'auto':
-        ymax = min_max_data['y_max']
-    elif y_transform is not None:
-        ymax = y_transform[0](ymax)
+def transform_histogram(counts, hist_transform):
+    """
+    Apply the histogram transform to counts, masking bins outside its domain
+    (e.g. empty bins for log10)
+    """
+    from . import transforms
 
-    if (y_transform is not None) and (ymin > ymax):
-        ymin, ymax = ymax, ymin
+    return transforms.apply_transform(hist_transform, counts)
 
-    if np.allclose(xmin, xmax, rtol=1e-20, atol=1e-100):
-        if draw_limits['x_axis'][0] == 'auto':
-            xmin = bracket_data(xmin, x_transform)[0]
-        if draw_limits['x_axis'][1] == 'auto':
-            xmax = bracket_data(xmax, x_transform)[1]
-    if np.allclose(ymin, ymax, rtol=1e-20, atol=1e-100):
-        if draw_limits['y_axis'][0] == 'auto':
-            ymin = bracket_data(ymin, y_transform)[0]
-        if draw_limits['y_axis'][1] == 'auto':
-            ymax = bracket_data(ymax, y_transform)[1]
 
-    xy_limits = [[xmin, xmax], [ymin, ymax]]
+def new_histogram2d(bins_x, bins_y, xy_limits, resolution,
+                    binned_statistic=False, weightings=None):
+    """
+    Create an empty histogram, with uniform bins over xy_limits for any axis
+    without bins already set (i.e. non-position axes). A binned statistic
+    histogram, or one accumulating several weightings, may be asked for.
+    """
+    from . import histogram
+    import numpy as np
 
-    if data_list_pass is None:
-        # Calculate bins for non-position axes
-        if bins_x is None:
-            bins_x = np.linspace(xmin, xmax, resolution+1)
-        if bins_y is None:
-            bins_y = np.linspace(ymin, ymax, resolution+1)
-
-        counts, xedges, yedges = np.histogram2d(x, y, bins=[bins_x, bins_y],
-                                                range=xy_limits,
-                                                weights=weights)
-        old_settings = np.geterr()
-        np.seterr(all='ignore')
-        if hist_transform is not None:
-            if not np.isfinite(hist_transform[0](0.0)):
-                mask = (counts == 0.0)
-            else:
-                mask = None
-            counts = hist_transform[0](counts)
-            if mask is not None:
-                counts[mask] = None
-        np.seterr(**old_settings)
+    (xmin, xmax), (ymin, ymax) = xy_limits
+    if bins_x is None:
+        bins_x = np.linspace(xmin, xmax, resolution+1)
+    if bins_y is None:
+        bins_y = np.linspace(ymin, ymax, resolution+1)
 
-    return [xedges, yedges, counts, min_max_data], xy_limits
+    if binned_statistic:
+        return histogram.BinnedStatistic2D(bins_x, bins_y)
+    if weightings is not None:
+        return histogram.MultiWeightHistogram2D(bins_x, bins_y, weightings)
+    return histogram.Histogram2D(bins_x, bins_y)
 
 
 def get_line_plot(x_field, x_index, x_unit, x_pos,
@@ -245,88 +605,36 @@ def get_line_plot(x_field, x_index, x_unit, x_pos,
         x[:] = x[sort_order]
         y[:] = y[sort_order]
 
-        # Scale to units
+        # Scale to units and transform, finding finite values and range
+        x_fac = 1.0
+        y_fac = 1.0
         if shared.config.get_safe('data', 'use_units') != 'off':
             if x_field is not None:
-                x_units = x_field.code_mks / x_unit
-                if x_units != 1.0:
-                    x[:] = x * x_units
+                x_fac = x_field.code_mks / x_unit
             if y_field is not None:
-                y_units = y_field.code_mks / y_unit
-                if y_units != 1.0:
-                    y[:] = y * y_units
-
-        # Perform transform
-        if (not x_pos) and (x_transform is not None):
-            x[:] = x_transform[0](x)
-        if (not y_pos) and (y_transform is not None):
-            y[:] = y_transform[0](y)
+                y_fac = y_field.code_mks / y_unit
+        mask, n_finite, min_max = scale_transform_finite(
+            [x, y], [x_fac, y_fac],
+            [None if x_pos else x_transform, None if y_pos else y_transform])
 
         # Check for invalid data
-        if (not np.isfinite(np.sum(x))) or (not np.isfinite(np.sum(y))):
+        if n_finite == 0:
+            raise ValueError('No valid values remaining!')
+        if mask is not None:
             print('Warning - invalidly transformed data skipped!')
-            x_mask = np.isfinite(x)
-            y_mask = np.isfinite(y)
-            mask_values = np.logical_and(x_mask, y_mask)
-            if not np.any(mask_values):
-                raise ValueError('No valid values remaining!')
-            x = x[mask_values]
-            y = y[mask_values]
+            data_array = data_array[mask]
 
         min_max_data = {}
-        min_max_data['x_min'] = x.min()
-        min_max_data['x_max'] = x.max()
-        min_max_data['y_min'] = y.min()
-        min_max_data['y_max'] = y.max()
-
-        # this may be unnecessary...
-        data_array[:, 0] = x
-        data_array[:, 1] = y
+        min_max_data['x_min'], min_max_data['x_max'] = min_max[0]
+        min_max_data['y_min'], min_max_data['y_max'] = min_max[1]
 
     else:
         # Use old data
         data_array, min_max_data = data_list_pass
 
     # Plot limits
-    xmin, xmax = draw_limits['x_axis']
-    ymin, ymax = draw_limits['y_axis']
-
-    if xmin == 'auto':
-        xmin = min_max_data['x_min']
-    elif x_transform is not None:
-        xmin = x_transform[0](xmin)
-    if xmax == 'auto':
-        xmax = min_max_data['x_max']
-    elif x_transform is not None:
-        xmax = x_transform[0](xmax)
-
-    if (x_transform is not None) and (xmin > xmax):
-        xmin, xmax = xmax, xmin
-
-    if ymin == 'auto':
-        ymin = min_max_data['y_min']
-    elif y_transform is not None:
-        ymin = y_transform[0](ymin)
-    if ymax == 'auto':
-        ymax = min_max_data['y_max']
-    elif y_transform is not None:
-        ymax = y_transform[0](ymax)
-
-    if (y_transform is not None) and (ymin > ymax):
-        ymin, ymax = ymax, ymin
-
-    if np.allclose(xmin, xmax, rtol=1e-20, atol=1e-100):
-        if draw_limits['x_axis'][0] == 'auto':
-            xmin = bracket_data(xmin, x_transform)[0]
-        if draw_limits['x_axis'][1] == 'auto':
-            xmax = bracket_data(xmax, x_transform)[1]
-    if np.allclose(ymin, ymax, rtol=1e-20, atol=1e-100):
-        if draw_limits['y_axis'][0] == 'auto':
-            ymin = bracket_data(ymin, y_transform)[0]
-        if draw_limits['y_axis'][1] == 'auto':
-            ymax = bracket_data(ymax, y_transform)[1]
-
-    xy_limits = [[xmin, xmax], [ymin, ymax]]
+    xy_limits = get_xy_limits(draw_limits, min_max_data,
+                              x_transform, y_transform)
 
     return [data_array, min_max_data], xy_limits
 
@@ -426,20 +734,21 @@ def get_render_plot(x_field, x_index, x_unit,
                 vector_field, vector_fac, data_limits,
                 proj, resolution, z_slice, step, shared)
 
-            if proj:
-                # account for integral over 0->1 instead of physical units
-                column_unit, unit_str = shared.config.get_safe_literal(
-                    'units', 'column', default=(x_unit, ''))
-                if (shared.config.get_safe('data', 'use_units') != 'off'):
-                    xy_fac = step.length_mks / column_unit
-                else:
-                    z_index = (set((0, 1, 2)) - set((x_index, y_index))).pop()
-                    xy_fac = step.box_length[z_index]
-                if xy_fac != 1.0:
-                    grid_data = grid_data * xy_fac
+        xy_fac = 1.0
+        if shared.ndim == 3 and proj:
+            # account for integral over 0->1 instead of physical units
+            column_unit, unit_str = shared.config.get_safe_literal(
+                'units', 'column', default=(x_unit, ''))
+            if (shared.config.get_safe('data', 'use_units') != 'off'):
+                xy_fac = step.length_mks / column_unit
+            else:
+                z_index = (set((0, 1, 2)) - set((x_index, y_index))).pop()
+                xy_fac = step.box_length[z_index]
 
-        if plot_transforms['render_transform'] is not None:
-            grid_data = plot_transforms['render_transform'][0](grid_data)
+        # Scale and transform in place, finding the range of finite values
+        grid_data = np.ascontiguousarray(grid_data, dtype=float)
+        mask, n_finite, min_max = scale_transform_finite(
+            [grid_data.reshape(-1)], [xy_fac], [render_transform])
 
         # Plot limits
         if (shared.config.get_safe('data', 'use_units') != 'off'):
@@ -460,14 +769,21 @@ def get_render_plot(x_field, x_index, x_unit,
         grid_data = data_list_pass[0]
         xmin, xmax = draw_limits['x_axis']
         ymin, ymax = draw_limits['y_axis']
+        mask, n_finite, min_max = scale_transform_finite(
+            [grid_data.reshape(-1)], [1.0], [None])
+
+    # Check for invalid data
+    if n_finite == 0:
+        raise ValueError('No valid values remaining!')
+    grid_range = min_max[0]
 
     cmin, cmax = draw_limits['render']
     if cmin == 'auto':
-        cmin = grid_data.min()
+        cmin = grid_range[0]
     elif render_transform is not None:
         cmin = render_transform[0](cmin)
     if cmax == 'auto':
-        cmax = grid_data.max()
+        cmax = grid_range[1]
     elif render_transform is not None:
         cmax = render_transform[0](cmax)
     if (render_transform is not None) and (cmin > cmax):
@@ -485,30 +801,81 @@ def get_render_plot(x_field, x_index, x_unit,
     return [grid_data], xy_limits, clim
 
 
+def iter_single_data(field, index, unit, transform,
+                     data_limits, step, shared):
+    """
+    Iterate over chunks of cell data of arbitrary quantity, dropping values
+    which are not finite after transforming, yielding (data_array, weights,
+    all_finite) for each chunk
+    """
+    from . import wrapper_functions as wf
+
+    # Unit scaling
+    units = 1.0
+    if (shared.config.get_safe('data', 'use_units') != 'off'):
+        if field is not None:
+            units = field.code_mks / unit
+
+    for data_array, weights in wf.iter_cell_data(
+            None, None, field, index, data_limits, step, shared):
+
+        # Scale to units and transform
+        mask = scale_transform_finite([data_array], [units], [transform])[0]
+
+        if mask is None:
+            yield data_array, weights, True
+        else:
+            yield data_array[mask], weights[mask], False
+
+
+def iter_multi_data(fields, indices, units, transforms,
+                    data_limits, step, shared):
+    """
+    Iterate over chunks of cell data of several quantities at once, yielding
+    (data_array, weights_list) for each chunk, with one column per quantity
+    """
+    from . import wrapper_functions as wf
+
+    # Unit scaling
+    factors = [1.0] * len(fields)
+    if (shared.config.get_safe('data', 'use_units') != 'off'):
+        factors = [field.code_mks / unit
+                   for field, unit in zip(fields, units)]
+
+    for data_array, weights_list in wf.iter_multi_cell_data(
+            fields, indices, data_limits, step, shared):
+
+        # Scale to units and transform
+        scale_transform_finite(
+            [data_array[:, i] for i in range(len(fields))], factors,
+            transforms)
+
+        yield data_array, weights_list
+
+
 def get_single_data(field, index, unit, transform,
                     data_limits, step, shared):
     """
     Obtain cell data of arbitrary quantity
     """
-    from . import wrapper_functions as wf
     import numpy as np
 
-    # Box length and transforms
-    box_length = step.box_length
-
-    data_array, weights = wf.get_cell_data(
-        None, None, field, index, data_limits, step, shared)
+    data_array_list = []
+    weights_list = []
+    all_finite = True
+    for data_array, weights, chunk_finite in iter_single_data(
+            field, index, unit, transform, data_limits, step, shared):
+        data_array_list.append(data_array)
+        weights_list.append(weights)
+        all_finite = all_finite and chunk_finite
 
-    # Scale to units
-    if (shared.config.get_safe('data', 'use_units') != 'off'):
-        if field is not None:
-            units = field.code_mks / unit
-            if units != 1.0:
-                data_array[:] = data_array * units
+    if not all_finite:
+        print('Warning - invalidly transformed data skipped!')
 
-    # Perform transform
-    if transform is not None:
-        data_array[:] = transform[0](data_array)
+    data_array = np.concatenate(data_array_list)
+    data_array_list = None
+    weights = np.concatenate(weights_list)
+    weights_list = None
 
     return data_array, weights
 
@@ -528,20 +895,40 @@ def get_box_data(field, index, unit, resolution, transform,
         None, None, None, field, index, None, None, None,
         resolution, data_limits, step, shared)
 
-    # Scale to units
+    # Unit scaling
+    units = 1.0
     if (shared.config.get_safe('data', 'use_units') != 'off'):
         if field is not None:
             units = field.code_mks / unit
-            if units != 1.0:
-                data_array[:] = data_array * units
 
-    # Perform transform
-    if transform is not None:
-        data_array[:] = transform[0](data_array)
+    # Scale to units and transform in place
+    scale_transform_finite([data_array], [units], [transform])
 
     return data_array, weights
 
 
+def get_box_vector_data(field, unit, resolution, data_limits, step, shared):
+    """
+    Obtain all components of a vector quantity sampled on a uniform grid,
+    together with the density if density weighting is selected
+    """
+    from . import wrapper_functions as wf
+
+    density_weighted = (shared.temp_config.get(
+        'velocity_spectrum_weighting', 'none') == 'density')
+
+    vector_array, rho = wf.get_sample_vector_data(
+        field, resolution, density_weighted, step, shared)
+
+    # Scale to units
+    if (shared.config.get_safe('data', 'use_units') != 'off'):
+        units = field.code_mks / unit
+        if units != 1.0:
+            vector_array *= units
+
+    return vector_array, rho
+
+
 def calc_PDF(data_array, weights, shared):
     import numpy as np
 
@@ -568,9 +955,9 @@ def calc_PDF(data_array, weights, shared):
     bin_min = shared.temp_config['PDF_bin_min']
     bin_max = shared.temp_config['PDF_bin_max']
     if bin_min == 'auto':
-        bin_min = data_array.min()
+        bin_min = minval
     if bin_max == 'auto':
-        bin_max = data_array.max()
+        bin_max = maxval
     bin_range = (bin_min, bin_max)
 
     if (bin_min == bin_max) and (num_bins == 1):
@@ -637,52 +1024,103 @@ def PDF_interactive(shared):
     shared.temp_config['PDF_bin_max'] = bin_max
 
 
-def calc_power_spectrum(data_array, weights, shared):
+def get_power_spectrum_grid(data_array, shared):
+    """
+    Reshape sampled data into an n^ndim cube (or square), checking that the
+    number of samples is consistent with this
+    """
     import numpy as np
 
+    ndim = shared.ndim
+    if not 2 <= ndim <= 3:
+        raise ValueError('Power spectra need 2D or 3D data!')
+
     n_tot = data_array.shape[0]
-    n_float = n_tot**(1.0/3.0)
-    n = np.rint(n_float)
-    if not np.allclose(n, n_float, rtol=1e-05, atol=1e-08):
-        raise ValueError('Not got a cube!')
-
-    n = int(n)
-
-    cells = data_array.reshape((n, n, n))
-
-    cells_F = np.fft.fftshift(np.fft.rfftn(cells), axes=(0, 1))
-    cells_P = np.real(cells_F * np.conjugate(cells_F))
-
-    if n % 2 == 1:
-        # not an even resolution
-        raise ValueError('Not using an even resolution number')
-
-    n_half = n / 2
-    n_bins = n_half - 2
-    bin_sum = np.zeros(n_bins)
-    bin_count = np.zeros(n_bins)
-
-    for i2 in range(n):
-        i = i2 - n_half
-        for j2 in range(n):
-            j = j2 - n_half
-            for k in range(n/2):
-                if (i == 0) and (j == 0) and (k == 0):
-                    continue
-                kr = np.sqrt(i**2 + j**2 + k**2)
-                slot = int(np.rint(kr)) - 1
-                if not (0 <= slot < n_bins):
-                    continue
-                bin_count[slot] += 1.0
-                bin_sum[slot] += (cells_P[i2, j2, k])
-
-    power = bin_sum / bin_count
-    k = np.arange(1, n_bins+1, dtype=np.float_)
+    n_float = n_tot**(1.0/ndim)
+    n = int(np.rint(n_float))
+    if n**ndim != n_tot:
+        if ndim == 3:
+            raise ValueError('Not got a cube!')
+        else:
+            raise ValueError('Not got a square!')
+
+    return data_array.reshape((n,)*ndim)
+
+
+def shell_average(power, n, bin_width=1.0):
+    """
+    Average the power in an rfftn output of an n^ndim grid over shells of
+    constant |k|. Shells are centred on integer multiples of bin_width, and
+    only include complete shells (up to the Nyquist wavenumber).
+
+    The last axis of an rfftn output only holds the non-negative half of the
+    wavenumbers; every mode except k_z=0 and (for even n) k_z=n/2 stands in
+    for itself and its complex conjugate, and so is counted twice.
+
+    Binning is done one slab of the first axis at a time to avoid creating
+    full-size wavenumber arrays.
+    """
+    import numpy as np
+
+    ndim = power.ndim
+    n_half = n // 2
+
+    # Integer wavenumbers along each axis
+    k_full = np.fft.fftfreq(n, 1.0/n)
+    k_last = np.arange(power.shape[-1], dtype=np.float64)
+
+    # rfft half-plane weighting
+    mode_weight = np.full(power.shape[-1], 2.0)
+    mode_weight[0] = 1.0
+    if n % 2 == 0:
+        mode_weight[-1] = 1.0
+
+    # Squared wavenumber over a slab (all axes except the first)
+    if ndim == 2:
+        k_sq_slab = k_last**2
+        weight_slab = mode_weight
+    else:
+        k_sq_slab = k_full[:, np.newaxis]**2 + k_last[np.newaxis, :]**2
+        weight_slab = np.broadcast_to(mode_weight, k_sq_slab.shape).ravel()
+
+    n_bins = int(np.floor(n_half / bin_width - 0.5))
+    if n_bins < 1:
+        raise ValueError('Bin width too large for resolution!')
+    max_slot = int(np.rint(np.sqrt(ndim) * n_half / bin_width)) + 1
+
+    bin_sum = np.zeros(max_slot + 1)
+    bin_count = np.zeros(max_slot + 1)
+
+    for i, k_first in enumerate(k_full):
+        k_mag = np.sqrt(k_sq_slab + k_first**2).ravel()
+        slot = np.rint(k_mag / bin_width).astype(np.intp)
+        bin_count += np.bincount(slot, weights=weight_slab,
+                                 minlength=max_slot + 1)
+        bin_sum += np.bincount(slot, weights=weight_slab * power[i].ravel(),
+                               minlength=max_slot + 1)
+
+    # Drop the k=0 bin and incomplete shells beyond the Nyquist wavenumber
+    bin_sum = bin_sum[1:n_bins+1]
+    bin_count = bin_count[1:n_bins+1]
+    k = np.arange(1, n_bins+1, dtype=np.float64) * bin_width
+
+    # Narrow bins at low k may contain no modes
+    filled = bin_count > 0.0
+    k = k[filled]
+    power_avg = bin_sum[filled] / bin_count[filled]
+
+    return k, power_avg
+
+
+def power_spectrum_extras(k, power, n):
+    """
+    Reference power law and tick positions for power spectrum plots
+    """
+    import numpy as np
 
     k_log_average = 10.0**(0.5 * np.log10(float(n)))
-    k_rint = max(1, int(np.rint(k_log_average)))
-    k_rint = min(k_rint, n)
-    P_0 = power[k_rint-1]
+    slot = np.argmin(np.fabs(k - k_log_average))
+    P_0 = power[slot]
 
     C = P_0 * k_log_average**4
 
@@ -693,8 +1131,378 @@ def calc_power_spectrum(data_array, weights, shared):
     k_log_max = int(np.ceil(np.log10(k[-1])))
     k_ticks = list(range(k_log_min, k_log_max+1))
 
-    return [k, power, {'extra_funcs': extra_funcs,
-                       'xticks': k_ticks}]
+    return {'extra_funcs': extra_funcs, 'xticks': k_ticks}
+
+
+def calc_power_spectrum(data_array, weights, shared):
+    import numpy as np
+
+    cells = get_power_spectrum_grid(data_array, shared)
+    n = cells.shape[0]
+
+    cells_F = np.fft.rfftn(cells)
+    cells_P = np.square(cells_F.real)
+    cells_P += np.square(cells_F.imag)
+    del cells_F
+
+    bin_width = shared.temp_config.get('power_spectrum_bin_width', 1.0)
+    k, power = shell_average(cells_P, n, bin_width)
+
+    return [k, power, power_spectrum_extras(k, power, n)]
+
+
+def power_spectrum_interactive(shared):
+    import numpy as np
+
+    while True:
+        input_string = input('Enter wavenumber bin width [default=1]: ')
+        input_string = input_string.strip()
+        if not input_string:
+            bin_width = 1.0
+            break
+        try:
+            bin_width = float(input_string)
+        except ValueError:
+            print(' >> Not a valid number!')
+            continue
+        if not (np.isfinite(bin_width) and bin_width > 0.0):
+            print(' >> Not a valid bin width!')
+            continue
+        break
+
+    shared.temp_config['power_spectrum_bin_width'] = bin_width
+
+
+def rfftn_float32(cells):
+    """
+    Single precision real FFT: numpy.fft keeps float32 input in single
+    precision from NumPy 2, as does scipy.fft; older numpy.fft works in
+    double precision
+    """
+    import numpy as np
+    if int(np.__version__.split('.')[0]) >= 2:
+        return np.fft.rfftn(cells)
+    try:
+        from scipy import fft as scipy_fft
+    except ImportError:
+        return np.fft.rfftn(cells).astype(np.complex64)
+    return scipy_fft.rfftn(cells, workers=-1)
+
+
+def calc_velocity_spectrum(data_array, weights, shared):
+    """
+    Kinetic energy spectrum of a vector field, split into solenoidal
+    (k-perpendicular) and compressive (k-parallel) parts. If weights are
+    provided they are the density, and sqrt(rho) v is transformed.
+
+    Each component is transformed in turn into one reused float32 buffer;
+    only the total power and the divergence k.F are kept between components,
+    so that the working memory is about four cubes.
+    """
+    import numpy as np
+
+    ndim = shared.ndim
+    if data_array.ndim != 2 or data_array.shape[1] != ndim:
+        raise ValueError('Velocity spectra need all vector components!')
+
+    shape = get_power_spectrum_grid(data_array[:, 0], shared).shape
+    n = shape[0]
+    half_shape = shape[:-1] + (n//2 + 1,)
+
+    if weights is not None:
+        sqrt_rho = np.sqrt(weights, out=weights).reshape(shape)
+    else:
+        sqrt_rho = None
+
+    # Integer wavenumbers along each axis, broadcastable to half_shape
+    k_axes = []
+    for axis in range(ndim):
+        if axis == ndim - 1:
+            k_axis = np.arange(n//2 + 1, dtype=np.float32)
+        else:
+            k_axis = np.fft.fftfreq(n, 1.0/n).astype(np.float32)
+        k_shape = [1] * ndim
+        k_shape[axis] = k_axis.size
+        k_axes.append(k_axis.reshape(k_shape))
+
+    buf = np.empty(shape, dtype=np.float32)
+    total_P = np.zeros(half_shape, dtype=np.float32)
+    div_F = np.zeros(half_shape, dtype=np.complex64)
+
+    for i in range(ndim):
+        buf[...] = data_array[:, i].reshape(shape)
+        if sqrt_rho is not None:
+            buf *= sqrt_rho
+        cells_F = rfftn_float32(buf)
+        total_P += np.square(cells_F.real)
+        total_P += np.square(cells_F.imag)
+        cells_F *= k_axes[i]
+        div_F += cells_F
+        cells_F = None
+
+    # Compressive power |k.F|^2 / k^2, stored in the (now free) real buffer
+    comp_P = buf.reshape(-1)[:total_P.size].reshape(half_shape)
+    np.square(div_F.real, out=comp_P)
+    comp_P += np.square(div_F.imag)
+    div_F = None
+    for i, comp_slab in enumerate(comp_P):
+        k_sq = k_axes[0][i]**2
+        for k_axis in k_axes[1:]:
+            k_sq = k_sq + np.square(k_axis[0])
+        k_sq[k_sq == 0.0] = 1.0
+        comp_slab /= k_sq
+
+    # Solenoidal power is what remains
+    total_P -= comp_P
+
+    bin_width = shared.temp_config.get('power_spectrum_bin_width', 1.0)
+    k, power_sol = shell_average(total_P, n, bin_width)
+    total_P = None
+    k, power_comp = shell_average(comp_P, n, bin_width)
+
+    extra_info = power_spectrum_extras(k, power_sol + power_comp, n)
+    extra_info['line_label'] = 'solenoidal'
+    extra_info['extra_lines'] = [(k, power_comp, 'compressive')]
+
+    return [k, power_sol, extra_info]
+
+
+def velocity_spectrum_interactive(shared):
+
+    power_spectrum_interactive(shared)
+
+    while True:
+        input_string = input('Weight by sqrt(density)? (y/n) '
+                             '[default=n]: ').strip().lower()
+        if not input_string or input_string == 'n':
+            weighting = 'none'
+            break
+        elif input_string == 'y':
+            weighting = 'density'
+            break
+        print(' >> Enter y or n!')
+
+    shared.temp_config['velocity_spectrum_weighting'] = weighting
+
+
+def get_radial_data(field, index, unit, transform, data_limits, step, shared):
+    """
+    Obtain cell data within the maximum radius of the radial profile centre.
+    Returns a (lazy) iterator over chunks of (radius, data, weights, mass),
+    and a dictionary of the radial bin edges and the enclosed mass label.
+    Radii are in position units, masses in sink mass units.
+    """
+    from . import wrapper_functions as wf
+    from . import menu_units
+    import numpy as np
+
+    ndim = shared.ndim
+    box_length = step.box_length
+    use_units = (shared.config.get_safe('data', 'use_units') != 'off')
+
+    # Conversion from box units to position (and mass) units
+    if use_units:
+        position_unit = menu_units.get_unit(shared, '_position')[0]
+        mass_unit, mass_unit_str = menu_units.get_unit(shared, 'sink_mass')
+        position_fac = step.length_mks / position_unit
+        mass_fac = (wf.get_code_mks(step.units, 'rho') *
+                    step.length_mks**ndim / mass_unit)
+        data_fac = field.code_mks / unit
+    else:
+        mass_unit_str = ''
+        position_fac = box_length[0]
+        mass_fac = box_length[0]**ndim
+        data_fac = 1.0
+
+    # Centre, in box units
+    centre = shared.temp_config['radial_profile_centre']
+    if centre == 'max_density':
+        centre = wf.find_density_maximum(data_limits, step, shared)
+    elif centre[0] == 'sink':
+        sink_data = step.sink_data
+        sink_mask = (sink_data['id'] == centre[1])
+        if not sink_mask.any():
+            raise ValueError('Sink {} not found!'.format(centre[1]))
+        centre = sink_data['position'][sink_mask][0] / box_length
+    else:
+        centre = np.array(centre[1]) / position_fac
+    if step.data_set is None:
+        step.load_dataset()
+
+    # Radial bins, logarithmic from the finest cell size outwards
+    r_max = shared.temp_config['radial_profile_max_radius']
+    if r_max == 'auto':
+        r_max = 0.5
+    else:
+        r_max = r_max / position_fac
+    r_min = 0.5 / step.minmax_res[1]
+    if not r_min < r_max:
+        raise ValueError('Maximum radius is smaller than the finest cells!')
+    bin_number = shared.temp_config['radial_profile_bin_number']
+    r_edges = np.logspace(np.log10(r_min), np.log10(r_max), bin_number+1)
+
+    weighting = shared.config.get('opts', 'weighting')
+    if weighting == 'mass' and field.name == 'rho':
+        # Density is never mass weighted
+        weighting = 'volume'
+
+    def iter_chunks():
+        for data_array, radii, volumes, masses in wf.iter_sphere_cell_data(
+                field, index, centre, r_max, data_limits, step, shared):
+
+            # Scale to units
+            if data_fac != 1.0:
+                data_array *= data_fac
+
+            # Perform transform
+            if transform is not None:
+                transform[0](data_array, out=data_array)
+
+            if weighting == 'mass':
+                weights = masses
+            elif weighting == 'count':
+                weights = np.ones_like(volumes)
+            else:
+                weights = volumes
+
+            yield radii * position_fac, data_array, weights, masses * mass_fac
+
+    radial_info = {'r_edges': r_edges * position_fac,
+                   'mass_label': 'Enclosed mass' + mass_unit_str}
+
+    return iter_chunks(), radial_info
+
+
+def calc_radial_profile(cell_chunks, radial_info, shared):
+    """
+    Weighted mean and dispersion of a quantity in logarithmic radial bins,
+    and the mass enclosed within each bin's outer edge, accumulated with
+    np.bincount in one pass over chunks of cells (see get_radial_data)
+    """
+    import numpy as np
+    from . import histogram
+
+    r_edges = radial_info['r_edges']
+    log_edges = np.log10(r_edges)
+    nbins = r_edges.size - 1
+
+    sum_w = np.zeros(nbins)
+    sum_wx = np.zeros(nbins)
+    sum_wxx = np.zeros(nbins)
+    sum_mass = np.zeros(nbins)
+    x_ref = None
+
+    for radii, data_array, weights, masses in cell_chunks:
+        if radii.size == 0:
+            continue
+
+        # Cells inside the innermost edge go in the first bin
+        log_r = np.log10(np.maximum(radii, r_edges[0]))
+        bin_index, in_range = histogram.uniform_bin_index(log_r, log_edges)
+
+        # Enclosed mass counts every cell, even if its value is invalid
+        sum_mass += np.bincount(bin_index[in_range],
+                                weights=masses[in_range], minlength=nbins)
+
+        valid = in_range
+        valid &= np.isfinite(data_array)
+        bin_index = bin_index[valid]
+
+        # Offset values by a reference, for a better-conditioned variance
+        data_array = data_array[valid]
+        weights = weights[valid]
+        if data_array.size == 0:
+            continue
+        if x_ref is None:
+            x_ref = np.average(data_array, weights=weights)
+        data_array = data_array - x_ref
+        wx = weights * data_array
+        sum_w += np.bincount(bin_index, weights=weights, minlength=nbins)
+        sum_wx += np.bincount(bin_index, weights=wx, minlength=nbins)
+        sum_wxx += np.bincount(bin_index, weights=wx*data_array,
+                               minlength=nbins)
+
+    if x_ref is None:
+        raise ValueError('No valid values remaining!')
+
+    old_settings = np.geterr()
+    np.seterr(all='ignore')
+    mean = sum_wx / sum_w
+    dispersion = np.sqrt(np.maximum(sum_wxx / sum_w - mean**2, 0.0))
+    mean += x_ref
+    np.seterr(**old_settings)
+
+    r_centres = np.sqrt(r_edges[:-1] * r_edges[1:])
+
+    extra_info = {'dispersion': dispersion,
+                  'r_edges': r_edges,
+                  'enclosed_mass': np.cumsum(sum_mass),
+                  'mass_label': radial_info['mass_label']}
+
+    return [r_centres, mean, extra_info]
+
+
+def radial_profile_interactive(shared):
+    import numpy as np
+
+    while True:
+        input_string = input('Enter centre: m for density maximum, s<id> '
+                             'for a sink, or a position [default=m]: ')
+        input_string = input_string.strip()
+        if not input_string or input_string == 'm':
+            centre = 'max_density'
+            break
+        if input_string.startswith('s'):
+            if not input_string[1:].strip().isdigit():
+                print(' >> Not a valid sink id!')
+                continue
+            centre = ('sink', int(input_string[1:]))
+            break
+        try:
+            position = [float(x) for x in
+                        input_string.replace(',', ' ').split()]
+        except ValueError:
+            print(' >> Not a valid position!')
+            continue
+        if (len(position) != shared.ndim or
+                not np.all(np.isfinite(position))):
+            print(' >> Position needs {} coordinates!'.format(shared.ndim))
+            continue
+        centre = ('point', position)
+        break
+
+    while True:
+        input_string = input('Enter maximum radius [default=auto]: ').strip()
+        if not input_string or input_string == 'auto':
+            r_max = 'auto'
+            break
+        try:
+            r_max = float(input_string)
+        except ValueError:
+            print(' >> Not a valid number!')
+            continue
+        if not (np.isfinite(r_max) and r_max > 0.0):
+            print(' >> Not a valid radius!')
+            continue
+        break
+
+    while True:
+        input_string = input('Enter number of bins [default=50]: ').strip()
+        if not input_string:
+            bin_number = 50
+            break
+        elif not input_string.isdigit():
+            print('  >> Invalid number of bins!')
+            continue
+        bin_number = int(input_string)
+        if not (1 <= bin_number <= 1e6):
+            print('  >> Invalid number of bins!')
+            continue
+        break
+
+    shared.temp_config['radial_profile_centre'] = centre
+    shared.temp_config['radial_profile_max_radius'] = r_max
+    shared.temp_config['radial_profile_bin_number'] = bin_number
 
 
 def get_analysis_list():
@@ -723,8 +1531,38 @@ def get_analysis_list():
                             'xlabel': 'Wavenumber',
                             'xticks': 'extra',
                             'ylabel': 'Power',
+                            'extra_interactive': power_spectrum_interactive,
                             'yticks': False}
     power_spectrum = analysis_tool(calc_power_spectrum, power_spectrum_props)
     analysis_list.append(power_spectrum)
 
+    velocity_spectrum_props = {'name': 'Velocity power spectrum',
+                               'file_ext': 'velspec',
+                               'data_type': 'vector_sample_data',
+                               'plot_type': 'power_spectrum',
+                               'special_limits': [True, True],
+                               'title': 'Velocity power spectrum',
+                               'data_axis': None,
+                               'xlabel': 'Wavenumber',
+                               'xticks': 'extra',
+                               'ylabel': 'Power',
+                               'extra_interactive':
+                                   velocity_spectrum_interactive,
+                               'yticks': False}
+    velocity_spectrum = analysis_tool(calc_velocity_spectrum,
+                                      velocity_spectrum_props)
+    analysis_list.append(velocity_spectrum)
+
+    radial_profile_props = {'name': 'Radial profile',
+                            'file_ext': 'radprof',
+                            'data_type': 'radial_cell_data',
+                            'plot_type': 'radial_profile',
+                            'special_limits': [True, False],
+                            'title': 'Radial profile',
+                            'data_axis': 'y',
+                            'xlabel': 'Radius',
+                            'extra_interactive': radial_profile_interactive}
+    radial_profile = analysis_tool(calc_radial_profile, radial_profile_props)
+    analysis_list.append(radial_profile)
+
     return analysis_list
@@ -0,0 +1,103 @@
+"""
+This submodule times the per-cell pipelines on large synthetic arrays, with
+and without blocked (cache-sized) execution
+"""
+
+from __future__ import print_function
+import timeit
+
+# input and xrange, Python 3 style
+try:
+    range = xrange
+    input = raw_input
+except NameError:
+    pass
+
+
+def time_best(func, repeats):
+    """
+    Best time of several runs of func
+    """
+    return min(timeit.repeat(func, number=1, repeat=repeats))
+
+
+def with_block_rows(rows, func):
+    """
+    Run func with blocked loops set to the given number of rows
+    """
+    from . import histogram
+
+    old_rows = histogram.block_rows
+    histogram.block_rows = rows
+    try:
+        return func()
+    finally:
+        histogram.block_rows = old_rows
+
+
+def benchmark_histogram2d(n=2**24, resolution=1024):
+    """
+    Scale, transform, finite check and bin n cells into a 2D histogram
+    """
+    from . import analysis
+    from . import histogram
+    import numpy as np
+
+    random = np.random.RandomState(0)
+    data = np.empty((n, 2))
+    data[:, 0] = random.lognormal(size=n)
+    data[:, 1] = random.normal(size=n)
+    weights = random.uniform(size=n)
+    log_transform = (np.log10, None)
+
+    def run():
+        data_array = data.copy()
+        x, y, cell_weights = analysis.prepare_xy_chunk(
+            data_array, weights, 3.0, 2.0, log_transform, None)[:3]
+        hist = histogram.Histogram2D(
+            np.linspace(-3.0, 3.0, resolution+1),
+            np.linspace(-10.0, 10.0, resolution+1))
+        hist.add(x, y, cell_weights)
+        return hist.counts
+
+    return run
+
+
+def benchmark_extra(n=2**24):
+    """
+    Evaluate |v| = (vx^2 + vy^2 + vz^2)^0.5 for n cells
+    """
+    from . import python_math_parser
+    import numpy as np
+
+    random = np.random.RandomState(0)
+    values = [random.normal(size=n) for i in range(3)]
+    parser = python_math_parser.PythonMathParser(['vx', 'vy', 'vz'])
+    parsed = parser.parse('(vx^2 + vy^2 + vz^2)^0.5')
+    calc = python_math_parser.RegisterCalc(parsed, ['vx', 'vy', 'vz'])
+
+    def run():
+        return calc(*values)
+
+    return run
+
+
+def run_benchmarks(n=2**24, repeats=3):
+    """
+    Print timings of each pipeline, whole-array and blocked
+    """
+    from . import histogram
+
+    for name, make_run in (('2D histogram', benchmark_histogram2d),
+                           ('extra quantity', benchmark_extra)):
+        run = make_run(n=n)
+        whole = with_block_rows(0, lambda: time_best(run, repeats))
+        blocked = with_block_rows(histogram.block_rows,
+                                  lambda: time_best(run, repeats))
+        print('{} ({} cells): whole arrays {:.3f}s, blocked {:.3f}s, '
+              'speed-up {:.2f}'.format(name, n, whole, blocked,
+                                       whole / blocked))
+
+
+if __name__ == '__main__':
+    run_benchmarks()
@@ -115,6 +115,12 @@ class SharedData():
         limits file splosh.limits in the current directory
         """
         self.save_config()
+        self.save_limits()
+
+    def save_limits(self, *args):
+        """
+        Save the limits file splosh.limits in the current directory
+        """
         limits_file = os.path.join(self.cwd, 'splosh.limits')
         with open(limits_file, 'w') as f:
             self.limits.write(f)
@@ -185,6 +191,9 @@ class DataField():
         self.name = name
         self.width = width
         self.extra = None       # Parsed expression for extra quantities
+        self.extra_expanded = None  # ...with other extras substituted
+        self.extra_steps = []   # Compiled evaluation steps for extras
+        self.extra_calc = {}    # Compiled last step, by constant factor
         if flags is None:
             self.flags = []
         else:
@@ -276,6 +285,7 @@ class ConfigOptions(SuperSafeConfigParser):
         self.add_section('opts')
         self.set('opts', 'show_sinks', 'on')
         self.set('opts', 'weighting', 'volume')
+        self.set('opts', 'hist2d_statistic', 'mean')
         self.set('opts', 'multiprocessing', 'off')
 
         self.add_section('limits')
@@ -290,6 +300,7 @@ class ConfigOptions(SuperSafeConfigParser):
         self.set('render', 'resolution', 'auto')
         self.set('render', 'cmap', 'OrRd')
         self.set('render', 'invert', 'no')
+        self.set('render', 'mipmap', 'mean')
 
         self.add_section('vector')
 
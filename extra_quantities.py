@@ -99,6 +99,7 @@ def add_quantity(shared, name=None, expression=None, no_save=False):
         else:
             extras_list.append(field_mapping.title)
             locals_list.append('')
+    extra_names = [title for title in extras_list if title]
 
     if name in locals_list:
         print(' >> Cannot edit datafile quantity!')
@@ -116,8 +117,9 @@ def add_quantity(shared, name=None, expression=None, no_save=False):
     else:
         exists = False
 
+    # Other extra quantities may be used, and are left as their titles
     parser = python_math_parser.PythonMathParser()
-    parser.set_locals(locals_list + data_constant_names)
+    parser.set_locals(locals_list + extra_names + data_constant_names)
     try:
         parsed = parser.parse(expression)
     except ValueError as e:
@@ -128,6 +130,8 @@ def add_quantity(shared, name=None, expression=None, no_save=False):
         if isinstance(item[0], basestring):
             if item[0] in data_constant_names:
                 item[0] = shared.data_constants[item[0]]
+            elif item[0] in extra_names:
+                pass
             else:
                 fm_slot = locals_list.index(item[0])
                 fm = shared.field_mappings[fm_slot]
@@ -140,12 +144,28 @@ def add_quantity(shared, name=None, expression=None, no_save=False):
     fm.field.extra = parsed
     fm.index = 1
     fm.extra = expression
-    fm.code_mks = wf.calc_units_mks(shared, fm.field)
+
+    # Check the new definition does not depend on itself
+    extra_fields = get_extra_fields(shared)
+    extra_fields[name] = fm.field
+    try:
+        expand_extra(parsed, extra_fields, (name,))
+    except ValueError as e:
+        print(' >> ' + str(e))
+        return
+
     if exists:
         shared.field_mappings[slot] = fm
     else:
         shared.field_mappings.append(fm)
 
+    # Quantities using this one may have changed too
+    plan_extras(shared)
+    for field_mapping in shared.field_mappings:
+        if field_mapping.extra is not None:
+            field_mapping.code_mks = wf.calc_units_mks(shared,
+                                                       field_mapping.field)
+
     if not no_save:
         shared.config.set('extra', name, expression)
 
@@ -175,8 +195,16 @@ def remove_quantity(shared):
             print('  >> Unknown quantity!')
             return
 
+    users = [fm.title for fm in shared.field_mappings
+             if fm.extra is not None and
+             input_string in get_extra_references(fm.field.extra)]
+    if users:
+        print('  >> Quantity is used by {}!'.format(', '.join(users)))
+        return
+
     shared.config.remove_option('extra', input_string)
     del shared.field_mappings[slot]
+    plan_extras(shared)
 
 
 def clear_quantities(shared):
@@ -200,7 +228,7 @@ def get_field_names(parsed):
     from ast import literal_eval
     field_names = set()
     for item in python_math_parser.walk(parsed):
-        if isinstance(item[0], basestring):
+        if isinstance(item[0], basestring) and is_field_leaf(item[0]):
             name, index, width = literal_eval(item[0])
             field_names.add(name)
 
@@ -214,8 +242,246 @@ def get_field_tuples(parsed):
     from ast import literal_eval
     field_tuples = set()
     for item in python_math_parser.walk(parsed):
-        if isinstance(item[0], basestring):
+        if isinstance(item[0], basestring) and is_field_leaf(item[0]):
             name, index, width = literal_eval(item[0])
             field_tuples.add((name, index, width))
 
     return list(field_tuples)
+
+
+def is_field_leaf(leaf):
+    """
+    Is a leaf of a parsed expression a datafile field tuple, rather than the
+    title of another extra quantity?
+    """
+    return leaf.startswith('(')
+
+
+def get_extra_references(parsed):
+    """
+    Titles of the other extra quantities used directly in parsed
+    """
+    references = set()
+    for item in python_math_parser.walk(parsed):
+        if isinstance(item[0], basestring) and not is_field_leaf(item[0]):
+            references.add(item[0])
+
+    return references
+
+
+def get_extra_fields(shared):
+    """
+    Fields of the extra quantities, by title
+    """
+    return dict((fm.title, fm.field) for fm in shared.field_mappings
+                if fm.extra is not None)
+
+
+def load_quantities(shared, items):
+    """
+    Add extra quantities from (name, expression) pairs, in order of their
+    dependencies, so that they may use each other whatever their order
+    """
+    pending = list(items)
+    parser = python_math_parser.PythonMathParser()
+    while pending:
+        titles = [fm.title for fm in shared.field_mappings]
+        names = [name for name, expression in pending]
+        parser.set_locals(titles + names +
+                          list(shared.data_constants.keys()))
+        for i, (name, expression) in enumerate(pending):
+            try:
+                tokens = parser.tokenize(expression)
+            except ValueError:
+                # add_quantity will report the problem
+                break
+            if not any(token in names for token in tokens
+                       if isinstance(token, basestring)):
+                break
+        else:
+            # Circular definitions: add_quantity will report them
+            i = 0
+        name, expression = pending.pop(i)
+        add_quantity(shared, name, expression, no_save=True)
+
+
+def expand_extra(parsed, extra_fields, stack=()):
+    """
+    Copy of parsed with other extra quantities replaced by their (expanded)
+    expressions, down to datafile fields. stack holds the titles being
+    expanded, to catch circular definitions.
+    """
+    UnaryOp = python_math_parser.UnaryOp
+    BinaryOp = python_math_parser.BinaryOp
+
+    if isinstance(parsed, list):
+        return [expand_extra(parsed[0], extra_fields, stack)]
+    elif isinstance(parsed, UnaryOp):
+        return UnaryOp(parsed.op, expand_extra(parsed.arg, extra_fields,
+                                               stack))
+    elif isinstance(parsed, BinaryOp):
+        return BinaryOp(parsed.op,
+                        expand_extra(parsed.left, extra_fields, stack),
+                        expand_extra(parsed.right, extra_fields, stack))
+    elif isinstance(parsed, basestring) and not is_field_leaf(parsed):
+        if parsed in stack:
+            raise ValueError('Circular definition {}!'.format(
+                ' -> '.join(stack[stack.index(parsed):] + (parsed,))))
+        if parsed not in extra_fields:
+            raise ValueError('Unknown quantity {}!'.format(parsed))
+        dependency = extra_fields[parsed].extra
+        if isinstance(dependency, list):
+            dependency = dependency[0]
+        return expand_extra(dependency, extra_fields, stack + (parsed,))
+    else:
+        return parsed
+
+
+def get_node_key(parsed):
+    """
+    Canonical source of (part of) an expanded expression, identifying it
+    across all extra quantities
+    """
+    UnaryOp = python_math_parser.UnaryOp
+    BinaryOp = python_math_parser.BinaryOp
+
+    if isinstance(parsed, list):
+        return get_node_key(parsed[0])
+    elif isinstance(parsed, UnaryOp):
+        return '({}{})'.format(parsed.op, get_node_key(parsed.arg))
+    elif isinstance(parsed, BinaryOp):
+        return '({}{}{})'.format(get_node_key(parsed.left), parsed.op,
+                                 get_node_key(parsed.right))
+    elif isinstance(parsed, float):
+        return repr(parsed)
+    else:
+        return parsed
+
+
+def plan_extras(shared):
+    """
+    Plan the evaluation of all extra quantities together. Each expression
+    is expanded through the quantities it uses; any operation occurring more
+    than once across all of them (and each quantity itself) becomes a step
+    of its own, planned once as a RegisterCalc (so evaluated without
+    temporaries at each operation), and evaluated only once per chunk of
+    cells (see calc_extra). Sets extra_expanded and extra_steps on each
+    extra quantity's field.
+    """
+    from ast import literal_eval
+    UnaryOp = python_math_parser.UnaryOp
+    BinaryOp = python_math_parser.BinaryOp
+
+    def unwrap(item):
+        while isinstance(item, list):
+            item = item[0]
+        return item
+
+    def children(item):
+        if isinstance(item, UnaryOp):
+            return [item.arg]
+        return [item.left, item.right]
+
+    extra_fields = get_extra_fields(shared)
+    expanded = {}
+    for title, field in extra_fields.items():
+        expanded[title] = expand_extra(field.extra, extra_fields, (title,))
+
+    # Count each operation over all quantities, with the operations it
+    # appears in
+    counts = {}
+    parents = {}
+    def count(item, parent_key):
+        item = unwrap(item)
+        if isinstance(item, (UnaryOp, BinaryOp)):
+            key = get_node_key(item)
+            counts[key] = counts.get(key, 0) + 1
+            parents.setdefault(key, set()).add(parent_key)
+            for child in children(item):
+                count(child, key)
+    for tree in expanded.values():
+        count(tree, None)
+
+    # Shared operations are steps, unless they only ever appear within one
+    # other shared operation
+    step_keys = set(get_node_key(tree) for tree in expanded.values())
+    for key, n in counts.items():
+        if n > 1:
+            parent_keys = parents[key]
+            if len(parent_keys) > 1 or None in parent_keys:
+                step_keys.add(key)
+            elif n > counts[list(parent_keys)[0]]:
+                step_keys.add(key)
+
+    for title, field in extra_fields.items():
+        steps = []
+        planned = set()
+
+        def split(item, top):
+            # Copy of item, with steps below it as leaves
+            item = unwrap(item)
+            if isinstance(item, (UnaryOp, BinaryOp)):
+                key = get_node_key(item)
+                if key in step_keys and not top:
+                    add_step(item)
+                    return [key]
+                if isinstance(item, UnaryOp):
+                    return [UnaryOp(item.op, split(item.arg, False))]
+                return [BinaryOp(item.op, split(item.left, False),
+                                 split(item.right, False))]
+            return [item]
+
+        def add_step(item):
+            key = get_node_key(item)
+            if key in planned:
+                return
+            tree = split(item, True)
+            inputs = []
+            for leaf in python_math_parser.walk(tree):
+                if (isinstance(leaf[0], basestring) and
+                        leaf[0] not in inputs):
+                    inputs.append(leaf[0])
+            # Inputs are earlier steps, or datafile fields
+            inputs = [(name, None if name in planned else literal_eval(name))
+                      for name in inputs]
+            func = python_math_parser.RegisterCalc(
+                tree, [name for name, field_tuple in inputs])
+            steps.append((key, inputs, tree, func))
+            planned.add(key)
+
+        add_step(unwrap(expanded[title]))
+        field.extra_expanded = expanded[title]
+        field.extra_steps = steps
+        field.extra_calc = {}
+
+
+def calc_extra(field, get_value, memo, factor=None):
+    """
+    Evaluate an extra quantity, one planned step at a time (see plan_extras).
+    get_value gives the data for a datafile field tuple. Results of every
+    step are kept in memo (one per chunk of cells), so operations shared
+    with other extra quantities are not recalculated. Any constant factor
+    is folded into the last step.
+    """
+    def calc_step(key, inputs, func):
+        args = []
+        for name, field_tuple in inputs:
+            if name not in memo:
+                memo[name] = get_value(field_tuple)
+            args.append(memo[name])
+        return func(*args)
+
+    for key, inputs, tree, func in field.extra_steps[:-1]:
+        if key not in memo:
+            memo[key] = calc_step(key, inputs, func)
+
+    key, inputs, tree, func = field.extra_steps[-1]
+    if factor is None or factor == 1.0:
+        if key not in memo:
+            memo[key] = calc_step(key, inputs, func)
+        return memo[key]
+
+    if factor not in field.extra_calc:
+        field.extra_calc[factor] = python_math_parser.RegisterCalc(
+            tree, [name for name, field_tuple in inputs], factor)
+    return calc_step(key, inputs, field.extra_calc[factor])
@@ -0,0 +1,395 @@
+"""
+This submodule implements a 2D histogram engine which accumulates counts one
+chunk of data at a time
+"""
+
+from __future__ import print_function
+import numpy as np
+
+
+# Rows handled at a time by blocked loops, so that each step of a per-cell
+# pipeline works on data still in cache (2**15 float64 values is 256 KiB).
+# Zero processes whole chunks at once.
+block_rows = 2**15
+
+
+def iter_blocks(n, rows=None):
+    """
+    Slices covering range(n) in blocks of rows (by default block_rows)
+    """
+    if rows is None:
+        rows = block_rows
+    if rows <= 0 or n <= rows:
+        yield slice(0, n)
+        return
+    for start in range(0, n, rows):
+        yield slice(start, min(start + rows, n))
+
+
+def edges_are_uniform(edges, rtol=1e-10):
+    """
+    Test whether bin edges are (to rounding) equally spaced
+    """
+    widths = np.diff(edges)
+    if widths.size == 0 or not np.all(widths > 0.0):
+        return False
+    return np.allclose(widths, widths[0], rtol=rtol, atol=0.0)
+
+
+def uniform_bin_index(values, edges):
+    """
+    Bin indices of values for equally spaced edges, found by scaling rather
+    than searching. Follows np.histogram conventions: bins are half-open,
+    except the last which includes the right edge. Returns (index, valid),
+    where index is only meaningful where valid is True.
+    """
+    nbins = edges.size - 1
+    lo = edges[0]
+    hi = edges[-1]
+
+    valid = (values >= lo)
+    valid &= (values <= hi)
+
+    index = np.subtract(values, lo)
+    index *= nbins / (hi - lo)
+    index[~valid] = 0.0
+    index = index.astype(np.intp)
+    np.clip(index, 0, nbins - 1, out=index)
+
+    # Correct for rounding in the scaling, so that the edges themselves
+    # decide which bin a value lies in
+    index -= (values < edges[index])
+    index += ((values >= edges[index + 1]) & (index != nbins - 1))
+
+    return index, valid
+
+
+def edges_bin_index(values, edges):
+    """
+    Bin indices of values for arbitrary (increasing) edges, found by binary
+    search, with the same conventions and return values as uniform_bin_index
+    """
+    nbins = edges.size - 1
+
+    valid = (values >= edges[0])
+    valid &= (values <= edges[-1])
+
+    index = np.searchsorted(edges, values, side='right') - 1
+    np.clip(index, 0, nbins - 1, out=index)
+
+    return index, valid
+
+
+class Histogram2D():
+    """
+    Weighted 2D histogram accumulated with np.bincount, one chunk of (x, y)
+    data at a time, so that the full x/y arrays are never needed in memory.
+
+    Edges are in the space the data is binned in (linear, or already
+    transformed, e.g. log10). For uniformly spaced edges bin indices are
+    found by scaling; other edges fall back to np.histogram2d per chunk.
+    """
+    def __init__(self, xedges, yedges):
+        self.xedges = np.asarray(xedges, dtype=np.float64)
+        self.yedges = np.asarray(yedges, dtype=np.float64)
+        self.nx = self.xedges.size - 1
+        self.ny = self.yedges.size - 1
+        self.uniform = (edges_are_uniform(self.xedges) and
+                        edges_are_uniform(self.yedges))
+        self.counts = np.zeros((self.nx, self.ny))
+
+    def __repr__(self):
+        return 'Histogram2D({}x{}, uniform={})'.format(self.nx, self.ny,
+                                                      self.uniform)
+
+    def bin_index(self, x, y):
+        """
+        Flattened bin index (x index * ny + y index) of each point, and
+        a mask of points lying within the histogram. Found one block of
+        points at a time, so the intermediate arrays stay in cache.
+        """
+        if self.uniform:
+            index_func = uniform_bin_index
+        else:
+            index_func = edges_bin_index
+
+        flat_index = np.empty(x.size, dtype=np.intp)
+        valid = np.empty(x.size, dtype=bool)
+        for block in iter_blocks(x.size):
+            ix, x_valid = index_func(x[block], self.xedges)
+            iy, y_valid = index_func(y[block], self.yedges)
+            ix *= self.ny
+            ix += iy
+            flat_index[block] = ix
+            np.logical_and(x_valid, y_valid, out=valid[block])
+        return flat_index, valid
+
+    def add(self, x, y, weights=None):
+        """
+        Add a chunk of points to the histogram
+        """
+        if x.size == 0:
+            return
+        if not self.uniform:
+            counts = np.histogram2d(x, y, bins=[self.xedges, self.yedges],
+                                    weights=weights)[0]
+            self.counts += counts
+            return
+
+        flat_index, valid = self.bin_index(x, y)
+        if not valid.all():
+            flat_index = flat_index[valid]
+            if weights is not None:
+                weights = weights[valid]
+
+        counts = np.bincount(flat_index, weights=weights,
+                             minlength=self.nx * self.ny)
+        self.counts += counts.reshape((self.nx, self.ny))
+
+    def covers(self, xedges, yedges, rtol=1e-6):
+        """
+        Can a histogram with the given uniform edges be rebinned from this
+        one? It must lie within this histogram's range and have bins no
+        finer than this histogram's.
+        """
+        if not self.uniform:
+            return False
+        for edges, own_edges in ((xedges, self.xedges),
+                                 (yedges, self.yedges)):
+            own_width = own_edges[1] - own_edges[0]
+            tol = rtol * (own_edges[-1] - own_edges[0])
+            if (edges[0] < own_edges[0] - tol or
+                    edges[-1] > own_edges[-1] + tol):
+                return False
+            width = (edges[-1] - edges[0]) / (edges.size - 1)
+            if width < own_width * (1.0 - rtol):
+                return False
+        return True
+
+    def rebin(self, xedges, yedges):
+        """
+        New histogram with the given edges, filled from the counts of this
+        one: each bin's counts are split between the new bins it overlaps,
+        in proportion to the area of overlap
+        """
+        new_hist = Histogram2D(xedges, yedges)
+
+        overlap, x_split, y_split = self.rebin_overlap(new_hist)
+        if self.counts[overlap].size == 0:
+            return new_hist
+        new_hist.counts += new_hist.rebin_counts(self.counts[overlap],
+                                                 x_split, y_split)
+
+        return new_hist
+
+    def rebin_overlap(self, new_hist):
+        """
+        Slices of this histogram's bins overlapping new_hist, and how they
+        split between its bins in x and in y (see split_bins)
+        """
+        ix0 = np.searchsorted(self.xedges, new_hist.xedges[0], 'right') - 1
+        ix1 = np.searchsorted(self.xedges, new_hist.xedges[-1], 'left')
+        iy0 = np.searchsorted(self.yedges, new_hist.yedges[0], 'right') - 1
+        iy1 = np.searchsorted(self.yedges, new_hist.yedges[-1], 'left')
+        ix0 = max(ix0, 0)
+        iy0 = max(iy0, 0)
+
+        x_split = split_bins(self.xedges[ix0:ix1+1], new_hist.xedges)
+        y_split = split_bins(self.yedges[iy0:iy1+1], new_hist.yedges)
+
+        return (slice(ix0, ix1), slice(iy0, iy1)), x_split, y_split
+
+    def rebin_counts(self, counts, x_split, y_split):
+        """
+        Counts of finer bins (split between this histogram's bins as given
+        by split_bins) summed into this histogram's bins, by area of overlap
+        """
+        nbins = self.nx * self.ny
+        new_counts = np.zeros(nbins)
+        x_index, x_fraction = x_split
+        y_index, y_fraction = y_split
+        for dx in (0, 1):
+            ix = x_index + dx
+            wx = x_fraction if dx == 0 else 1.0 - x_fraction
+            x_valid = (ix >= 0) & (ix < self.nx) & (wx > 0.0)
+            for dy in (0, 1):
+                iy = y_index + dy
+                wy = y_fraction if dy == 0 else 1.0 - y_fraction
+                y_valid = (iy >= 0) & (iy < self.ny) & (wy > 0.0)
+                if not (x_valid.any() and y_valid.any()):
+                    continue
+                part = (counts[np.ix_(x_valid, y_valid)] *
+                        np.outer(wx[x_valid], wy[y_valid]))
+                flat_index = np.add.outer(ix[x_valid] * self.ny,
+                                          iy[y_valid])
+                new_counts += np.bincount(flat_index.ravel(),
+                                          weights=part.ravel(),
+                                          minlength=nbins)
+        return new_counts.reshape((self.nx, self.ny))
+
+
+def split_bins(edges, new_edges):
+    """
+    How bins with the given edges split between the uniform bins of
+    new_edges, which are no narrower: the index of the new bin containing
+    each bin's lower edge (possibly outside the new bins), and the fraction
+    of the bin lying in it; the rest lies in the next new bin
+    """
+    width = (new_edges[-1] - new_edges[0]) / (new_edges.size - 1)
+    lower = (edges[:-1] - new_edges[0]) / width
+    upper = (edges[1:] - new_edges[0]) / width
+    index = np.floor(lower).astype(np.intp)
+    fraction = (np.minimum(upper, index + 1) - lower) / (upper - lower)
+    return index, np.clip(fraction, 0.0, 1.0)
+
+
+class MultiWeightHistogram2D(Histogram2D):
+    """
+    2D histogram accumulating several weightings (e.g. count, volume and
+    mass) in one pass: bin indices are found once per chunk, then there is
+    one np.bincount per weighting. counts is the selected weighting.
+    """
+    def __init__(self, xedges, yedges, weightings, weighting=None):
+        Histogram2D.__init__(self, xedges, yedges)
+        self.weightings = tuple(weightings)
+        self.weighted_counts = dict(
+            (name, np.zeros((self.nx, self.ny))) for name in self.weightings)
+        self.select(self.weightings[0] if weighting is None else weighting)
+
+    def __repr__(self):
+        return 'MultiWeightHistogram2D({}x{}, {}, uniform={})'.format(
+            self.nx, self.ny, '/'.join(self.weightings), self.uniform)
+
+    def select(self, weighting):
+        """
+        Make counts those of the given weighting
+        """
+        if weighting not in self.weighted_counts:
+            raise ValueError('Unknown weighting {}!'.format(weighting))
+        self.weighting = weighting
+        self.counts = self.weighted_counts[weighting]
+
+    def add(self, x, y, weights=None):
+        """
+        Add a chunk of points to the histogram. weights has one column for
+        each weighting other than 'count', in order; 'count' is unweighted.
+        """
+        if x.size == 0:
+            return
+        flat_index, valid = self.bin_index(x, y)
+        if not valid.all():
+            flat_index = flat_index[valid]
+            if weights is not None:
+                weights = weights[valid]
+
+        nbins = self.nx * self.ny
+        column = 0
+        for name in self.weightings:
+            if name == 'count':
+                counts = np.bincount(flat_index, minlength=nbins)
+            else:
+                counts = np.bincount(flat_index, weights=weights[:, column],
+                                     minlength=nbins)
+                column += 1
+            self.weighted_counts[name] += counts.reshape((self.nx, self.ny))
+
+    def rebin(self, xedges, yedges):
+        """
+        New histogram with the given edges, filled from every weighting of
+        this one in the same way as Histogram2D.rebin
+        """
+        new_hist = MultiWeightHistogram2D(xedges, yedges, self.weightings,
+                                          self.weighting)
+
+        overlap, x_split, y_split = self.rebin_overlap(new_hist)
+        if self.counts[overlap].size == 0:
+            return new_hist
+        for name in self.weightings:
+            new_hist.weighted_counts[name] += new_hist.rebin_counts(
+                self.weighted_counts[name][overlap], x_split, y_split)
+
+        return new_hist
+
+
+class BinnedStatistic2D(Histogram2D):
+    """
+    2D histogram which also accumulates a statistic (weighted mean,
+    dispersion or maximum) of a further quantity in each bin, one chunk at a
+    time. Sums of weights, weighted values and weighted squared values are
+    accumulated with np.bincount alongside the counts.
+    """
+    statistics = ('mean', 'max', 'dispersion')
+
+    def __init__(self, xedges, yedges):
+        Histogram2D.__init__(self, xedges, yedges)
+        self.sum_w = np.zeros(self.nx * self.ny)
+        self.sum_wv = np.zeros(self.nx * self.ny)
+        self.sum_wvv = np.zeros(self.nx * self.ny)
+        self.max = np.full(self.nx * self.ny, -np.inf)
+        self.value_ref = None
+
+    def __repr__(self):
+        return 'BinnedStatistic2D({}x{}, uniform={})'.format(
+            self.nx, self.ny, self.uniform)
+
+    def add(self, x, y, weights=None, values=None, value_weights=None):
+        """
+        Add a chunk of points to the histogram, with their values (and the
+        weights of the values) for the statistic. Points with non-finite
+        values count towards the histogram only.
+        """
+        if x.size == 0:
+            return
+        flat_index, valid = self.bin_index(x, y)
+        nbins = self.nx * self.ny
+
+        counts = np.bincount(flat_index[valid], minlength=nbins,
+                             weights=None if weights is None
+                             else weights[valid])
+        self.counts += counts.reshape((self.nx, self.ny))
+
+        valid &= np.isfinite(values)
+        if not valid.any():
+            return
+        flat_index = flat_index[valid]
+        values = values[valid]
+        if value_weights is None:
+            value_weights = np.ones_like(values)
+        else:
+            value_weights = value_weights[valid]
+
+        # Offset values by a reference, for a better-conditioned variance
+        if self.value_ref is None:
+            self.value_ref = values.mean()
+        offset_values = values - self.value_ref
+        wv = value_weights * offset_values
+        self.sum_w += np.bincount(flat_index, weights=value_weights,
+                                  minlength=nbins)
+        self.sum_wv += np.bincount(flat_index, weights=wv, minlength=nbins)
+        self.sum_wvv += np.bincount(flat_index, weights=wv*offset_values,
+                                    minlength=nbins)
+        np.maximum.at(self.max, flat_index, values)
+
+    def statistic(self, name):
+        """
+        The statistic ('mean', 'max' or 'dispersion') in each bin, with NaN
+        for bins without values
+        """
+        if name not in self.statistics:
+            raise ValueError('Unknown statistic {}!'.format(name))
+        old_settings = np.geterr()
+        np.seterr(all='ignore')
+        filled = (self.sum_w > 0.0)
+        result = np.full(self.nx * self.ny, np.nan)
+        if name == 'max':
+            result[filled] = self.max[filled]
+        else:
+            mean = self.sum_wv[filled] / self.sum_w[filled]
+            if name == 'mean':
+                result[filled] = mean + self.value_ref
+            else:
+                variance = self.sum_wvv[filled] / self.sum_w[filled] - mean**2
+                result[filled] = np.sqrt(np.maximum(variance, 0.0))
+        np.seterr(**old_settings)
+
+        return result.reshape((self.nx, self.ny))
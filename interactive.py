@@ -165,8 +165,7 @@ def create_field_mappings(shared):
                 fm.index = i
                 field_mappings.append(fm)
 
-    for name, expression in shared.config.items('extra'):
-        extra_quantities.add_quantity(shared, name, expression, no_save=True)
+    extra_quantities.load_quantities(shared, shared.config.items('extra'))
 
     return
 
@@ -325,23 +324,38 @@ def plotting_options(y_axis, shared):
     from . import plots
     from numpy import isfinite
 
-    # Find x axis
     if y_axis == -1:
-        # time plots
+        # time plots, of one or more axes
         if len(shared.sim_step_list) == 1:
             print(' >> Need more than one timestep!')
             return
         elif shared.temp_config['last_time_axis'] == -5:
-            prompt = 'Enter axis for time plots: '
+            prompt = 'Enter axis (or axes) for time plots: '
         else:
-            prompt = 'Enter axis for time plots [default={}]: '
+            prompt = 'Enter axis (or axes) for time plots [default={}]: '
             prompt = prompt.format(shared.temp_config['last_time_axis']+1)
-    else:
-        if shared.temp_config['last_x_axis'] == -5:
-            prompt = 'Enter x axis (or 0 for 1D plots): '
+        input_string = input(prompt).strip()
+        if input_string:
+            axis_strings = input_string.replace(',', ' ').split()
+            if not all(axis_string.isdigit() for axis_string in axis_strings):
+                print(' >> Invalid choice!')
+                return
+            time_axes = [int(axis_string) - 1 for axis_string in axis_strings]
         else:
-            prompt = 'Enter x axis (or 0 for 1D plots) [default={}]: '.format(
-                shared.temp_config['last_x_axis']+1)
+            time_axes = [shared.temp_config['last_time_axis']]
+        for time_axis in time_axes:
+            if not (0 <= time_axis < len(shared.field_mappings)):
+                print(' >> Invalid choice!')
+                return
+        time_plotting(shared, time_axes)
+        return
+
+    # Find x axis
+    if shared.temp_config['last_x_axis'] == -5:
+        prompt = 'Enter x axis (or 0 for 1D plots): '
+    else:
+        prompt = 'Enter x axis (or 0 for 1D plots) [default={}]: '.format(
+            shared.temp_config['last_x_axis']+1)
     input_string = input(prompt).strip()
     if input_string:
         if not input_string.isdigit():
@@ -349,10 +363,7 @@ def plotting_options(y_axis, shared):
             return
         x_axis = int(input_string) - 1
     else:
-        if y_axis == -1:
-            x_axis = shared.temp_config['last_time_axis']
-        else:
-            x_axis = shared.temp_config['last_x_axis']
+        x_axis = shared.temp_config['last_x_axis']
     if not (-1 <= x_axis < len(shared.field_mappings)):
         print(' >> Invalid choice!')
         return
@@ -360,11 +371,6 @@ def plotting_options(y_axis, shared):
         print (' >> x-axis and y-axis must be different!')
         return
 
-    if y_axis == -1:
-        # If doing time plots, leave here
-        time_plotting(shared, x_axis)
-        return
-
     if x_axis == -1:
         # If doing single axis plots, leave here
         single_axis_plotting(shared, y_axis)
@@ -380,6 +386,36 @@ def plotting_options(y_axis, shared):
 
     # Check if we have two position coordinates, otherwise plot scatterplot
     if not (x_pos and y_pos):
+        # Phase diagrams may be coloured by a statistic of a third quantity
+        colour = None
+        colour_index = None
+        if shared.ndim > 1 and not (x_pos or y_pos):
+            prompt = ('Enter quantity to colour by (0 for frequency '
+                      'density) [default=0]: ')
+            input_string = input(prompt).strip()
+            if input_string and input_string != '0':
+                if not input_string.isdigit():
+                    print(' >> Invalid choice!')
+                    return
+                colour = int(input_string) - 1
+                if not (0 <= colour < len(shared.field_mappings)):
+                    print(' >> Invalid choice!')
+                    return
+                if 'position' in shared.field_mappings[colour].field.flags:
+                    print(' >> Colouring quantity must not be a position!')
+                    return
+                colour_index = shared.field_mappings[colour].index
+                statistics = ['mean', 'max', 'dispersion']
+                default = shared.config.get('opts', 'hist2d_statistic')
+                prompt = ('Statistic: 1) mean 2) max 3) dispersion '
+                          '[default={}]: ').format(default)
+                input_string = input(prompt).strip()
+                if input_string:
+                    if input_string not in ('1', '2', '3'):
+                        print(' >> Invalid choice!')
+                        return
+                    shared.config.set('opts', 'hist2d_statistic',
+                                      statistics[int(input_string) - 1])
         backend = prompt_for_backend(shared)
         if backend is None:
             return
@@ -387,8 +423,8 @@ def plotting_options(y_axis, shared):
             plot_type = 'line_plot'
         else:
             plot_type = 'hist2d'
-        plots.plot_fields(x_axis, x_index, y_axis, y_index, None, None, None,
-                          plot_type, None, backend, shared)
+        plots.plot_fields(x_axis, x_index, y_axis, y_index, colour,
+                          colour_index, None, plot_type, None, backend, shared)
         shared.temp_config['last_x_axis'] = x_axis
         return
 
@@ -485,45 +521,64 @@ def plotting_options(y_axis, shared):
     return
 
 
-def time_plotting(shared, axis):
+def time_plotting(shared, axes):
     """
-    Show menu for time-based plots (sum, mean, rms, max/min etc)
+    Show menu for time-based plots (sum, mean, rms, max/min etc), of one or
+    more axes; each snapshot is read once for all of them
     """
-    import numpy as np
     from . import plots
-
-    operation_list = [('mean', 'mean', lambda x, w: np.sum(x*w)/np.sum(w)),
-                      ('rms', 'rms',
-                       lambda x, w: np.sqrt(np.sum(w*(x**2))/np.sum(w))),
-                      ('min', 'min', lambda x, w: np.min(x)),
-                      ('max', 'max', lambda x, w: np.max(x)),
-                      ('sum(value * weight)', 'sum', lambda x, w: np.sum(x*w))]
-
-    # Field properties
-    field = shared.field_mappings[axis].field
-    index = shared.field_mappings[axis].index
+    from .analysis import StreamReduction
+
+    operation_list = [('mean', 'mean', lambda: StreamReduction('mean')),
+                      ('rms', 'rms', lambda: StreamReduction('rms')),
+                      ('min', 'min', lambda: StreamReduction('min')),
+                      ('max', 'max', lambda: StreamReduction('max')),
+                      ('sum(value * weight)', 'sum',
+                       lambda: StreamReduction('sum')),
+                      ('median', 'median',
+                       lambda: StreamReduction('quantile', 0.5)),
+                      ('5th percentile', 'p5',
+                       lambda: StreamReduction('quantile', 0.05)),
+                      ('95th percentile', 'p95',
+                       lambda: StreamReduction('quantile', 0.95))]
 
     # Check if we do not have position coordinates
-    if 'position' in field.flags:
-        print('  >> Cannot do time plots for position axes!')
-        return
+    for axis in axes:
+        if 'position' in shared.field_mappings[axis].field.flags:
+            print('  >> Cannot do time plots for position axes!')
+            return
 
     option_list = []
     for i in range(len(operation_list)):
         option_list.append('{}) {}'.format(i+1, operation_list[i][0]))
     print('  '.join(option_list))
-    while True:
-        input_string = input('Enter type of time-based plot: ').strip()
-        if not input_string:
-            return
-        elif not input_string.isdigit():
-            print('  >> Invalid entry!')
-            continue
-        time_type = int(input_string)
-        if not (1 <= time_type <= len(operation_list)):
-            print('  >> Invalid entry!')
-            continue
-        break
+
+    # One or more operations for each axis
+    time_series = []
+    for axis in axes:
+        if len(axes) == 1:
+            prompt = 'Enter type(s) of time-based plot: '
+        else:
+            prompt = 'Enter type(s) of time-based plot for {}: '.format(
+                shared.field_mappings[axis].title)
+        while True:
+            input_string = input(prompt).strip()
+            if not input_string:
+                return
+            type_strings = input_string.replace(',', ' ').split()
+            if not type_strings or not all(
+                    type_string.isdigit() for type_string in type_strings):
+                print('  >> Invalid entry!')
+                continue
+            time_types = [int(type_string) for type_string in type_strings]
+            if not all(1 <= time_type <= len(operation_list)
+                       for time_type in time_types):
+                print('  >> Invalid entry!')
+                continue
+            break
+        index = shared.field_mappings[axis].index
+        for time_type in time_types:
+            time_series.append((axis, index, operation_list[time_type-1]))
 
     # prompt for backend
     backend = prompt_for_backend(shared)
@@ -531,8 +586,7 @@ def time_plotting(shared, axis):
         return
 
     # move to plotting
-    plots.plot_time(axis, index, operation_list[time_type-1],
-                    backend, shared)
+    plots.plot_time(time_series, backend, shared)
     return
 
 
@@ -223,4 +223,89 @@ def snap_to_grid(xlim, ylim, x_pos, y_pos, box_length, minmax_res):
     return x_new_lim, y_new_lim        
     
     
-    
\ No newline at end of file
+    
+
+# Settings for scan_step, set before the worker processes are forked
+scan_settings = {}
+
+
+def scan_step(step_no):
+    """
+    Reduce one output to a quantile sketch of each scanned quantity
+    """
+    from . import analysis
+    from . import quantile_sketch
+
+    shared = scan_settings['shared']
+    field_mappings = scan_settings['field_mappings']
+    units = scan_settings['units']
+    data_limits = scan_settings['data_limits']
+
+    step = shared.sim_step_list[step_no]
+    if step.data_set is None:
+        step.load_dataset()
+
+    sketches = [quantile_sketch.TDigest() for fm in field_mappings]
+    for cell_data, weights_list in analysis.iter_multi_data(
+            [fm.field for fm in field_mappings],
+            [fm.index for fm in field_mappings],
+            units, [None] * len(field_mappings), data_limits, step, shared):
+        for i, sketch in enumerate(sketches):
+            sketch.update(cell_data[:, i], weights_list[i])
+
+    return sketches
+
+
+def scan_global_limits(field_mappings, shared):
+    """
+    Find a quantile sketch of each quantity (in current units, without
+    transforms) over all cells of every output, reading the outputs in
+    parallel. Sketches of each output are merged, so percentiles hold for
+    all outputs at once.
+    """
+    from . import menu_units
+    from . import quantile_sketch
+    import multiprocessing
+
+    units = []
+    for fm in field_mappings:
+        units.append(menu_units.get_unit(shared, '_' + fm.field.name)[0])
+    data_limits = get_current_limits(None, None, None, None, None, None,
+                                     None, None, shared)[1]
+
+    scan_settings.update({'shared': shared,
+                          'field_mappings': field_mappings,
+                          'units': units,
+                          'data_limits': data_limits})
+    nstep = len(shared.sim_step_list)
+    processes = min(nstep, multiprocessing.cpu_count())
+    sketches = [quantile_sketch.TDigest() for fm in field_mappings]
+    try:
+        if processes > 1:
+            # Workers see scan_settings (and compiled extra quantities,
+            # which cannot be pickled) by being forked
+            if hasattr(multiprocessing, 'get_context'):
+                pool = multiprocessing.get_context('fork').Pool(processes)
+            else:
+                pool = multiprocessing.Pool(processes)
+            try:
+                step_sketches = pool.imap_unordered(scan_step, range(nstep))
+                for i, output_sketches in enumerate(step_sketches):
+                    print('Scanned {} of {} outputs'.format(i+1, nstep))
+                    for sketch, output_sketch in zip(sketches,
+                                                     output_sketches):
+                        sketch.merge(output_sketch)
+                pool.close()
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            for i in range(nstep):
+                print('Scanning output {}...'.format(
+                    shared.sim_step_list[i].output_dir))
+                for sketch, output_sketch in zip(sketches, scan_step(i)):
+                    sketch.merge(output_sketch)
+    finally:
+        scan_settings.clear()
+
+    return sketches
@@ -178,3 +178,80 @@ def reset_restriction_limits(shared, *args):
     return
 
 
+
+
+def scan_limits(shared, *args):
+    """
+    Scan every output for the global range of quantities, setting their
+    plot limits to chosen percentiles over all outputs, so that every step
+    is plotted on the same scale
+    """
+    from . import limits
+    
+    scan_ids = [i for i, fm in enumerate(shared.field_mappings)
+                if 'position' not in fm.field.flags]
+    if not scan_ids:
+        print(' >> No quantities to scan!')
+        return
+    
+    for i in scan_ids:
+        print('({}) {}'.format(i+1, shared.field_mappings[i].title))
+    prompt = 'Enter quantities to scan [default=all]: '
+    while True:
+        input_string = input(prompt).strip()
+        if not input_string:
+            break
+        try:
+            choices = [int(x) - 1 for x in input_string.split()]
+        except ValueError:
+            print(' >> Invalid input string!')
+            continue
+        if not all(x in scan_ids for x in choices):
+            print(' >> Invalid choice!')
+            continue
+        scan_ids = choices
+        break
+    
+    prompt = 'Enter lower and upper percentiles for limits [default=0 100]: '
+    while True:
+        input_string = input(prompt).strip()
+        if not input_string:
+            percentiles = (0.0, 100.0)
+            break
+        try:
+            percentiles = tuple(float(x) for x in input_string.split())
+        except ValueError:
+            print(' >> Not a valid number!')
+            continue
+        if (len(percentiles) != 2 or
+                not 0.0 <= percentiles[0] < percentiles[1] <= 100.0):
+            print(' >> Percentiles are not valid!')
+            continue
+        break
+    
+    field_mappings = [shared.field_mappings[i] for i in scan_ids]
+    sketches = limits.scan_global_limits(field_mappings, shared)
+    
+    if not shared.limits.has_section('scanned'):
+        shared.limits.add_section('scanned')
+    for fm, sketch in zip(field_mappings, sketches):
+        if sketch.count == 0:
+            print(' >> No valid values of {}!'.format(fm.title))
+            continue
+        new_limits = tuple(float(sketch.percentile(p)) for p in percentiles)
+        scanned = {'min': float(sketch.min), 'max': float(sketch.max),
+                   'percentiles': percentiles, 'limits': new_limits}
+        shared.limits.set('scanned', fm.title, repr(scanned))
+        print('{} : min {:g}, max {:g}, limits ( {:g} : {:g} )'.format(
+            fm.title, scanned['min'], scanned['max'], *new_limits))
+        if not new_limits[0] < new_limits[1]:
+            print(' >> Limits of {} are not valid! (min >= max)'.format(
+                fm.title))
+            continue
+        shared.limits.set('limits', fm.title, repr(new_limits))
+    
+    # Use the scanned limits on every step
+    shared.config.set('limits', 'adaptive', 'fixed')
+    shared.save_limits()
+    
+    return
@@ -0,0 +1,55 @@
+"""
+This submodule implements the movie backend.
+"""
+
+from __future__ import print_function
+import numpy as np
+from png_backend import BackendPNG
+
+class BackendMovie(BackendPNG):
+    """
+    Backend for writing movies: a numbered sequence of PNG frames, one per
+    step, rendered in parallel with the same limits on every frame, then
+    joined into a movie if a matplotlib animation writer is available
+    """
+
+    def __init__(self):
+        BackendPNG.__init__(self)
+        self.name = '\\MOV'
+        self.long_name = 'Movie backend (parallel PNG frames)'
+        self.parallel = True
+        self.movie_writer = 'ffmpeg'
+        self.movie_extension = '.mp4'
+        self.fps = 10
+
+    def write_movie(self, frame_filenames):
+        """
+        Join the frames into a movie, if the animation writer is available
+        """
+        from matplotlib import animation
+        from matplotlib.image import imread
+
+        if not frame_filenames:
+            return
+        if not animation.writers.is_available(self.movie_writer):
+            print('Frames written; no {} writer available to join them'.format(
+                self.movie_writer))
+            return
+
+        # Movie is named as the frames, without the frame number
+        movie_filename = (frame_filenames[0].rsplit('_', 1)[0] +
+                          self.movie_extension)
+        print('Writing to file {}...'.format(movie_filename))
+
+        first_frame = imread(frame_filenames[0] + '.png')
+        height, width = first_frame.shape[:2]
+        dpi = 100.0
+        fig = self.Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+        self.FigureCanvas(fig)
+        image = fig.figimage(first_frame)
+
+        writer = animation.writers[self.movie_writer](fps=self.fps)
+        with writer.saving(fig, movie_filename, dpi):
+            for filename in frame_filenames:
+                image.set_data(imread(filename + '.png'))
+                writer.grab_frame()
@@ -53,6 +53,56 @@ def decode_symbol(symbol_string):
     else:
         return symbol_dict[symbol_string]
 
+def reduce_2x2(data, reduction='mean'):
+    """
+    Reduce a 2D map by half on each side, taking the mean (ignoring NaNs) or
+    maximum of each 2x2 block of pixels, one block of rows at a time. Odd
+    sides are padded with NaN.
+    """
+    from . import histogram
+    ny, nx = data.shape
+    out_ny, out_nx = (ny + 1) // 2, (nx + 1) // 2
+    out = np.empty((out_ny, out_nx), dtype=data.dtype)
+    rows = max(1, histogram.block_rows // out_nx)
+    for block in histogram.iter_blocks(out_ny, rows):
+        in_rows = data[2*block.start:2*block.stop]
+        n_rows = block.stop - block.start
+        if in_rows.shape != (2 * n_rows, 2 * out_nx):
+            padded = np.full((2 * n_rows, 2 * out_nx), np.nan,
+                             dtype=data.dtype)
+            padded[:in_rows.shape[0], :nx] = in_rows
+            in_rows = padded
+        quads = in_rows.reshape(n_rows, 2, out_nx, 2)
+        if reduction == 'max':
+            out[block] = np.fmax(np.fmax(quads[:, 0, :, 0], quads[:, 0, :, 1]),
+                                 np.fmax(quads[:, 1, :, 0], quads[:, 1, :, 1]))
+        elif np.isfinite(np.sum(quads)):
+            out[block] = quads.sum(axis=(1, 3)) * 0.25
+        else:
+            finite = np.isfinite(quads)
+            total = np.where(finite, quads, 0.0).sum(axis=(1, 3))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                out[block] = total / finite.sum(axis=(1, 3))
+    return out
+
+def build_mipmaps(data, reduction='mean', min_size=64):
+    """
+    Mipmap pyramid of a 2D map: the map, then maps reduced by 2x2 blocks
+    until the smaller side is below 2*min_size. Returns a list of
+    (map, (x_fraction, y_fraction)), where the fractions scale the extent of
+    the original map to that of the (padded) level.
+    """
+    levels = [(data, (1.0, 1.0))]
+    ny, nx = data.shape
+    level = data
+    scale = 1
+    while min(level.shape) >= 2 * min_size:
+        level = reduce_2x2(level, reduction)
+        scale *= 2
+        levels.append((level, (float(level.shape[1] * scale) / nx,
+                               float(level.shape[0] * scale) / ny)))
+    return levels
+
 
 class BackendMPL():
     """
@@ -67,6 +117,23 @@ class BackendMPL():
         import matplotlib
         matplotlib.rcParams['text.usetex'] = False
         self.mpl_marker_size = matplotlib.rcParams['lines.markersize']
+        
+        # Batch and interactive backends keep one figure, updating the
+        # artists of image plots in place while the figure layout stays the
+        # same; figure_updated is None after a full build, 'style' if only
+        # the colour map changed and 'data' otherwise
+        self.fig = None
+        self.reuse_figure = False
+        self.figure_key = None
+        self.figure_artists = None
+        self.figure_updated = None
+        
+        # Interactive backends show render maps reduced to the canvas size,
+        # from a mipmap pyramid; file backends always use the full map
+        self.use_mipmaps = False
+        self.render_levels = None
+        self.render_level = None
+        self.render_extent = None
     
     def on_exit(self):
         """
@@ -180,6 +247,25 @@ class BackendMPL():
             sink_plot_x = sink_x[sink_mask]
             sink_plot_y = sink_y[sink_mask]
         
+        # Update the previous figure in place, if it has the same layout
+        plot_type = self.plot_options['plot_type']
+        figure_key = self.get_figure_key()
+        if (self.reuse_figure and figure_key is not None and
+                figure_key == self.figure_key):
+            if sink_data is None:
+                self.figure_updated = self.update_figure(
+                    limits, clim, None, None)
+            else:
+                self.figure_updated = self.update_figure(
+                    limits, clim, sink_plot_x, sink_plot_y)
+            self.output_canvas()
+            return
+        self.figure_key = None
+        self.figure_artists = None
+        self.figure_updated = None
+        if self.reuse_figure:
+            self.fig.clf()
+        
         # Create figure
         ax = self.fig.add_subplot(111)
         self.main_axes = ax
@@ -188,27 +274,38 @@ class BackendMPL():
         if 'cmap' in self.plot_options:
             cmap = self.plot_options['cmap']
         
-        plot_type = self.plot_options['plot_type']
-        
         if plot_type == 'time':
             x = self.data_list[0][:, 0]
-            y = self.data_list[0][:, 1]
-            time_plot = ax.plot(x, y, 'r')
+            nseries = self.data_list[0].shape[1] - 1
+            if nseries > 1:
+                # Stacked panels sharing the time axis; the last is the main
+                # axes, the others take their own y ranges
+                ax.remove()
+                series_labels = self.plot_options['series_labels']
+                ax = None
+                for i in range(nseries):
+                    ax = self.fig.add_subplot(nseries, 1, i+1, sharex=ax)
+                    ax.plot(x, self.data_list[0][:, i+1], 'r')
+                    ax.set_ylabel(mathtexify(series_labels[i]))
+                    if i < nseries - 1:
+                        ax.tick_params(labelbottom=False)
+                self.main_axes = ax
+            else:
+                y = self.data_list[0][:, 1]
+                time_plot = ax.plot(x, y, 'r')
             ax.set_xlim(limits[0])
             ax.set_ylim(limits[1])
             clim = None
         
         elif plot_type == 'hist2d':
             
-            xedges, yedges, counts, min_max_data = self.data_list
+            xedges, yedges, counts, min_max_data = self.data_list[:4]
             
             img = ax.pcolorfast(xedges, yedges, counts.T, cmap=cmap)
             ax.set_xlim(xedges[0], xedges[-1])
             ax.set_ylim(yedges[0], yedges[-1])
             
-            clim = list(img.get_clim())
-            if clim[0] == clim[1]:
-                clim[0] = 0.0
+            clim = self.get_hist2d_clim(img)
             img.set_clim(clim)
         
         elif plot_type == 'line_plot':
@@ -230,9 +327,18 @@ class BackendMPL():
             else:
                 imshow_aspect = self.plot_options['aspect']
             
-            img = ax.imshow(self.data_list[0], interpolation='none',
+            self.render_extent = imshow_limits
+            self.set_render_levels(self.data_list[0])
+            self.render_level, level_limits = self.get_render_level()
+            img = ax.imshow(self.render_level, interpolation='none',
                             origin='lower', aspect=imshow_aspect, cmap=cmap,
-                            extent=imshow_limits)
+                            extent=level_limits)
+            ax.set_xlim(limits[0])
+            ax.set_ylim(limits[1])
+            # Resample before colour mapping, so that redraws (e.g. on colour
+            # map changes) map screen pixels rather than the whole grid
+            if hasattr(img, 'set_interpolation_stage'):
+                img.set_interpolation_stage('data')
             
             img.set_clim(clim)
         
@@ -310,7 +416,22 @@ class BackendMPL():
                 if qy_transform is not None:
                     y = qy_transform[0](y)
                 
-                single_axis_plot = ax.plot(x, y, 'k', label='')
+                legend = False
+                line_label = ''
+                if 'line_label' in extra_info:
+                    line_label = mathtexify(extra_info['line_label'])
+                    legend = True
+                single_axis_plot = ax.plot(x, y, 'k', label=line_label)
+                
+                if 'extra_lines' in extra_info:
+                    for x_line, y_line, label in extra_info['extra_lines']:
+                        if qx_transform is not None:
+                            x_line = qx_transform[0](x_line)
+                        if qy_transform is not None:
+                            y_line = qy_transform[0](y_line)
+                        ax.plot(x_line, y_line, '--',
+                                label=mathtexify(label))
+                        legend = True
                 
                 xlim = ax.get_xlim()
                 ylim = ax.get_ylim()
@@ -318,10 +439,8 @@ class BackendMPL():
                 
                 x_points = np.linspace(xlim[0], xlim[1], res)
                 if qx_transform is not None:
-                    x_untransformed = qx_transform[1](x_points).astype(
-                        np.float_)
+                    x_untransformed = qx_transform[1](x_points)
                 
-                legend = False
                 extra_plots = []
                 for extra_func in extra_info['extra_funcs']:
                     func, label = extra_func
@@ -341,6 +460,43 @@ class BackendMPL():
                 if legend:
                     ax.legend(loc='center right')
                 clim = None
+
+            elif plot_type.properties['plot_type'] == 'radial_profile':
+                r, mean, extra_info = self.data_list
+                dispersion = extra_info['dispersion']
+                r_outer = extra_info['r_edges'][1:]
+                enclosed_mass = extra_info['enclosed_mass']
+
+                if qx_transform is not None:
+                    r = qx_transform[0](r)
+                    r_outer = qx_transform[0](r_outer)
+
+                # Mean, with a band of one dispersion either side
+                ax.fill_between(r, mean - dispersion, mean + dispersion,
+                                color='0.8')
+                single_axis_plot = ax.plot(r, mean, 'k')
+
+                if limits is not None:
+                    if limits[0] != ['auto', 'auto']:
+                        ax.set_xlim(limits[0])
+                    if limits[1] != ['auto', 'auto']:
+                        ax.set_ylim(limits[1])
+
+                # Enclosed mass on a second y axis
+                mass_ax = ax.twinx()
+                mass_ax.plot(r_outer, enclosed_mass, 'b--')
+                if enclosed_mass[-1] > 0.0:
+                    mass_ax.set_yscale('log')
+                mass_ax.set_ylabel(mathtexify(extra_info['mass_label']),
+                                   color='b')
+                # Keep the main axes on top, to receive mouse events
+                ax.set_zorder(mass_ax.get_zorder() + 1)
+                ax.patch.set_visible(False)
+
+                xlim = ax.get_xlim()
+                ylim = ax.get_ylim()
+                self.current_xylimits = [xlim, ylim]
+                clim = None
             else:
                 print('Backend does not support plot type: ',
                       plot_type.properties['plot_type'])
@@ -350,9 +506,11 @@ class BackendMPL():
             self.current_clim = clim
         
         # Plot sinks
+        sink_line = None
         if sink_data is not None:
-            ax.plot(sink_plot_x, sink_plot_y, linestyle='None',
-                    scalex=False, scaley=False, **sink_plot_dict)
+            sink_line = ax.plot(sink_plot_x, sink_plot_y, linestyle='None',
+                                scalex=False, scaley=False,
+                                **sink_plot_dict)[0]
         
         # Plot styling
         #self.fig.set_tight_layout = True
@@ -379,9 +537,10 @@ class BackendMPL():
                 ax.set_yticks([])
             else:
                 ax.set_yticks(yticks)
+        time_text = None
         if 'time_label' in self.plot_options:
             time_label = mathtexify(self.plot_options['time_label'])
-            ax.text(0.95, 0.95, time_label,
+            time_text = ax.text(0.95, 0.95, time_label,
                     horizontalalignment='right',
                     verticalalignment='top',
                     transform = ax.transAxes)
@@ -416,9 +575,167 @@ class BackendMPL():
             cbar.formatter.set_useOffset(False)
             cbar.update_ticks()
         
+        if plot_type in ('render', 'hist2d'):
+            self.figure_key = figure_key
+            self.figure_artists = {'img': img, 'cbar': cbar,
+                                   'time_text': time_text,
+                                   'sink_line': sink_line,
+                                   'data': self.data_list[:3]}
+        
         # Write figure to file
         self.output_canvas()
         
         return
     
+    def get_figure_key(self):
+        """
+        Key of everything about an image plot (render or 2D histogram) that
+        fixes the figure layout, or None for other plots. Plots with the same
+        key differ only in their data, limits, colour map, time and sinks.
+        """
+        plot_type = self.plot_options['plot_type']
+        if plot_type not in ('render', 'hist2d'):
+            return None
+        varying = ('time', 'time_label', 'sink_data', 'sink_options', 'cmap')
+        options = sorted((key, repr(value))
+                         for key, value in self.plot_options.items()
+                         if key not in varying)
+        return (repr(options), np.shape(self.data_list[0]),
+                self.plot_options['sink_data'] is None)
+    
+    def update_figure(self, limits, clim, sink_plot_x, sink_plot_y):
+        """
+        Update the artists of the previous image plot with new data,
+        limits, colour map, time and sinks, keeping its axes, colourbar and
+        labels. Returns 'style' if only the colour map changed, else 'data'.
+        """
+        ax = self.main_axes
+        artists = self.figure_artists
+        img = artists['img']
+        plot_type = self.plot_options['plot_type']
+        cmap = self.plot_options.get('cmap')
+        new_data = self.data_list[:3]
+        same_data = (len(new_data) == len(artists['data']) and
+                     all(new is old for new, old in
+                         zip(new_data, artists['data'])))
+        
+        if plot_type == 'render':
+            extent = (limits[0][0], limits[0][1], limits[1][0], limits[1][1])
+            same_data = (same_data and
+                         tuple(self.render_extent) == extent and
+                         tuple(img.get_clim()) == tuple(clim))
+            if self.data_list[0] is not artists['data'][0]:
+                self.set_render_levels(self.data_list[0])
+            self.render_extent = extent
+            self.show_render_level()
+            img.set_cmap(cmap)
+            img.set_clim(clim)
+        elif same_data:
+            # Same histogram, so only the colour map can have changed
+            img.set_cmap(cmap)
+            clim = self.current_clim
+        else:
+            # Bin edges may change, so the mesh is replaced
+            xedges, yedges, counts = self.data_list[:3]
+            img.remove()
+            img = ax.pcolorfast(xedges, yedges, counts.T, cmap=cmap)
+            ax.set_xlim(xedges[0], xedges[-1])
+            ax.set_ylim(yedges[0], yedges[-1])
+            clim = self.get_hist2d_clim(img)
+            img.set_clim(clim)
+            artists['img'] = img
+        artists['data'] = new_data
+        
+        self.current_xylimits = limits
+        self.current_clim = clim
+        
+        cbar = artists['cbar']
+        if cbar is not None:
+            try:
+                cbar.update_normal(img)
+            except AttributeError:
+                cbar.update_bruteforce(img)
+            # A new norm resets the ticks, so they are set again
+            if 'colourbar_ticks' in self.plot_options:
+                cbar.set_ticks(self.plot_options['colourbar_ticks'])
+            cbar.formatter.set_useOffset(False)
+            cbar.update_ticks()
+        
+        if artists['time_text'] is not None:
+            time_label = mathtexify(self.plot_options['time_label'])
+            same_data = same_data and (
+                artists['time_text'].get_text() == time_label)
+            artists['time_text'].set_text(time_label)
+        if artists['sink_line'] is not None:
+            sink_line = artists['sink_line']
+            same_data = (same_data and
+                         np.array_equal(sink_line.get_xdata(), sink_plot_x) and
+                         np.array_equal(sink_line.get_ydata(), sink_plot_y))
+            artists['sink_line'].set_data(sink_plot_x, sink_plot_y)
+        
+        if same_data:
+            return 'style'
+        else:
+            return 'data'
+    
+    def get_hist2d_clim(self, img):
+        """
+        Colour limits of a 2D histogram: fixed ones if given (e.g. for every
+        frame of a movie), else the range of the drawn values
+        """
+        fixed_clim = self.draw_limits.get('hist2d_clim')
+        if fixed_clim is not None:
+            return list(fixed_clim)
+        clim = list(img.get_clim())
+        if clim[0] == clim[1]:
+            clim[0] = 0.0
+        return clim
+    
+    def set_render_levels(self, data):
+        """
+        Keep the rendered map, with its mipmap pyramid if the backend shows
+        reduced maps
+        """
+        reduction = self.plot_options.get('mipmap', 'off')
+        if self.use_mipmaps and reduction != 'off':
+            self.render_levels = build_mipmaps(data, reduction)
+        else:
+            self.render_levels = [(data, (1.0, 1.0))]
+        self.render_level = None
+    
+    def get_render_level(self):
+        """
+        The coarsest level of the rendered map with at least one pixel per
+        canvas pixel of the main axes, and its extent
+        """
+        bbox = self.main_axes.get_window_extent()
+        level, fraction = self.render_levels[0]
+        for next_level, next_fraction in self.render_levels[1:]:
+            ny, nx = next_level.shape
+            if (nx < bbox.width * next_fraction[0] or
+                    ny < bbox.height * next_fraction[1]):
+                break
+            level, fraction = next_level, next_fraction
+        xmin, xmax, ymin, ymax = self.render_extent
+        extent = (xmin, xmin + (xmax - xmin) * fraction[0],
+                  ymin, ymin + (ymax - ymin) * fraction[1])
+        return level, extent
+    
+    def show_render_level(self):
+        """
+        Show the level of the rendered map matching the canvas size, in the
+        render extent. Returns True if the level changed.
+        """
+        img = self.figure_artists['img']
+        level, extent = self.get_render_level()
+        changed = level is not self.render_level
+        if changed:
+            img.set_data(level)
+            self.render_level = level
+        img.set_extent(extent)
+        xmin, xmax, ymin, ymax = self.render_extent
+        self.main_axes.set_xlim(xmin, xmax)
+        self.main_axes.set_ylim(ymin, ymax)
+        return changed
+    
     
\ No newline at end of file
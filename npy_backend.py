@@ -4,25 +4,181 @@ This submodule implements the NPY backend.
 
 from __future__ import print_function
 import numpy as np
+from collections import OrderedDict
 from stream_backend import BackendStream
 
 class BackendNPY(BackendStream):
     """
-    Backend for writing to Numpy binary files
+    Backend for writing to Numpy binary files: each plot is a directory of
+    .npy arrays (grids and edges as plotted, not expanded into tables),
+    with a JSON sidecar describing the fields, units, transforms, time and
+    extent, so that other tools can memory-map the arrays
     """
-    
+
     def __init__(self):
         BackendStream.__init__(self)
-        self.name = '\NPY'
+        self.name = '\\NPY'
         self.long_name = 'Numpy binary file backend'
         self.extension = '.npy'
-        
+        self.metadata_filename = 'metadata.json'
+        self.arrays = None
+
+    def plot_data(self):
+        """
+        Take a data_list and 'plot' to a directory of arrays
+        """
+        plot_type = self.plot_options['plot_type']
+        arrays = OrderedDict()
+
+        if (plot_type == 'time') or (plot_type == 'line_plot'):
+            arrays['data'] = (self.data_list[0], ['row', 'column'])
+
+        elif plot_type == 'hist2d':
+            xedges, yedges, counts = self.data_list[:3]
+            arrays['xedges'] = (xedges, ['x'])
+            arrays['yedges'] = (yedges, ['y'])
+            arrays['values'] = (counts, ['x', 'y'])
+
+        elif plot_type == 'render':
+            arrays['image'] = (self.data_list[0], ['y', 'x'])
+
+        else:
+            # Single axis plots, transformed as drawn
+            data_axis = self.plot_options['data_axis']
+            if data_axis != 'x':
+                qx_transform = self.plot_transforms['qx_transform']
+            else:
+                qx_transform = None
+            if data_axis != 'y':
+                qy_transform = self.plot_transforms['qy_transform']
+            else:
+                qy_transform = None
+
+            single_type = plot_type.properties['plot_type']
+            if single_type == 'hist1d':
+                counts, bins, extra_info = self.data_list
+                if qy_transform is not None:
+                    counts = qy_transform[0](counts)
+                arrays['bins'] = (bins, ['x'])
+                arrays['counts'] = (counts, ['x'])
+
+            elif single_type == 'power_spectrum':
+                x, y, extra_info = self.data_list
+                if qx_transform is not None:
+                    x = qx_transform[0](x)
+                if qy_transform is not None:
+                    y = qy_transform[0](y)
+                arrays['x'] = (x, ['x'])
+                arrays['y'] = (y, ['x'])
+                for i, (x_line, y_line, label) in enumerate(
+                        extra_info.get('extra_lines', [])):
+                    if qy_transform is not None:
+                        y_line = qy_transform[0](y_line)
+                    arrays['y_{}'.format(i+1)] = (y_line, ['x'])
+
+            elif single_type == 'radial_profile':
+                r, mean, extra_info = self.data_list
+                r_edges = extra_info['r_edges']
+                if qx_transform is not None:
+                    r = qx_transform[0](r)
+                    r_edges = qx_transform[0](r_edges)
+                arrays['r'] = (r, ['r'])
+                arrays['mean'] = (mean, ['r'])
+                arrays['dispersion'] = (extra_info['dispersion'], ['r'])
+                arrays['r_edges'] = (r_edges, ['r'])
+                arrays['enclosed_mass'] = (extra_info['enclosed_mass'],
+                                           ['r'])
+
+            else:
+                # Fall back to the table of the generic stream backend
+                self.arrays = None
+                BackendStream.plot_data(self)
+                return
+
+        self.arrays = arrays
+
+        # Write figure to file
+        self.output_canvas()
+
+    def get_metadata(self):
+        """
+        Description of the current plot for the JSON sidecar
+        """
+        plot_type = self.plot_options['plot_type']
+        if not isinstance(plot_type, basestring):
+            plot_type = plot_type.properties['plot_type']
+
+        metadata = OrderedDict()
+        metadata['plot_type'] = plot_type
+        for key in ('title', 'xlabel', 'ylabel', 'colourbar_label',
+                    'time', 'time_unit', 'time_label', 'fields'):
+            if key in self.plot_options:
+                metadata[key] = self.plot_options[key]
+        metadata['transforms'] = dict(
+            (key, value) for key, value in self.transform_keys.items()
+            if value not in (None, 'none'))
+        metadata['extent'] = self.draw_limits.get('xy_limits')
+        metadata['limits'] = dict(
+            (key, value) for key, value in self.draw_limits.items()
+            if key != 'xy_limits')
+
+        return metadata
+
     def output_canvas(self):
         """
         Output canvas
         """
-        import numpy as np
-        filename = self.output_filename + self.extension
-        print('Writing to file {}...'.format(filename))
-        with open(filename, 'wb') as f:
-            np.save(f, self.data_array)
+        import os
+        import json
+
+        dirname = self.output_filename
+        print('Writing to directory {}...'.format(dirname))
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+        if self.arrays is None:
+            arrays = {'data': (self.data_array, ['row', 'column'])}
+        else:
+            arrays = self.arrays
+
+        metadata = self.get_metadata()
+        metadata['arrays'] = OrderedDict()
+        for name, (array, axes) in arrays.items():
+            array = np.asarray(array)
+            filename = name + self.extension
+            write_array(os.path.join(dirname, filename), array)
+            metadata['arrays'][name] = OrderedDict([
+                ('file', filename), ('shape', list(array.shape)),
+                ('dtype', array.dtype.str), ('axes', axes)])
+
+        with open(os.path.join(dirname, self.metadata_filename), 'w') as f:
+            json.dump(metadata, f, indent=2, default=json_default)
+
+
+def write_array(filename, array, block_rows=2**16):
+    """
+    Write an array to a .npy file through a memory map, one block of rows
+    at a time, so that no second full-size buffer is needed
+    """
+    from numpy.lib.format import open_memmap
+
+    if array.ndim == 0 or array.size == 0:
+        np.save(filename, array)
+        return
+    out = open_memmap(filename, mode='w+', dtype=array.dtype,
+                      shape=array.shape)
+    for start in range(0, array.shape[0], block_rows):
+        out[start:start+block_rows] = array[start:start+block_rows]
+    out.flush()
+    del out
+
+
+def json_default(value):
+    """
+    Convert numpy scalars and arrays for JSON
+    """
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError('{!r} is not JSON serializable'.format(value))
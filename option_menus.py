@@ -119,9 +119,16 @@ def init_options(options, shared):
                       'print_call': lookup_single}
     subopts.append(SubOption('set sink particle symbol edge width',
                              single_numeric_option, info))
-    info = {'config_item': 'weighting', 'flip_opts': ['volume', 'mass'],
+    info = {'config_item': 'weighting',
+            'flip_opts': ['volume', 'mass', 'count'],
             'print_call': lookup_single}
-    subopts.append(SubOption('Weighting of histograms (not y-axis density)',
+    subopts.append(SubOption('Weighting of histograms (not y-axis density; '
+                             'count acts as volume for sampled data)',
+                             single_flip_option, info))
+    info = {'config_item': 'hist2d_statistic',
+            'flip_opts': ['mean', 'max', 'dispersion'],
+            'print_call': lookup_single}
+    subopts.append(SubOption('Statistic for coloured 2D histograms',
                              single_flip_option, info))
     info = {'config_item': 'multiprocessing', 'flip_opts': ['off', 'on'],
             'print_call': lookup_single}
@@ -154,6 +161,8 @@ def init_options(options, shared):
                              menu_limits.reset_limits))
     subopts.append(SubOption('reset data limits for all columns',
                              menu_limits.reset_restriction_limits))
+    subopts.append(SubOption('scan all outputs for global plot limits',
+                             menu_limits.scan_limits))
     info = {'config_item': 'aspect_ratio', 'flip_opts': ['off', 'on'],
             'print_call': lookup_single}
     subopts.append(SubOption('auto-adjust limits to match '
@@ -199,6 +208,10 @@ def init_options(options, shared):
             'print_call': lookup_single}
     subopts.append(SubOption('invert colour scheme',
                              single_flip_option, info))
+    info = {'config_item': 'mipmap', 'flip_opts': ['mean', 'max', 'off'],
+            'print_call': lookup_single}
+    subopts.append(SubOption('reduce large maps on screen (mean/max/off)',
+                             single_flip_option, info))
     options['r'] = Option('(r)ender', 'Rendering options',
                           option_menu, subopts, 'render')
     # Vector plot menu
@@ -290,15 +303,16 @@ def lookup_single(shared, config_section, info):
 
 def single_flip_option(shared, config_section, info):
     """
-    Flip a single option in the config file between two allowed values
+    Flip a single option in the config file between allowed values (cycling
+    through them if there are more than two)
     """
     config = shared.config
     cur_value = config.get(config_section, info['config_item'])
     values = info['flip_opts']
-    if cur_value == info['flip_opts'][0]:
-        set_value = info['flip_opts'][1]
+    if cur_value in values:
+        set_value = values[(values.index(cur_value) + 1) % len(values)]
     else:
-        set_value = info['flip_opts'][0]
+        set_value = values[0]
     config.set(config_section, info['config_item'], set_value)
 
     if 'post_action' in info:
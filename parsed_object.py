@@ -72,6 +72,235 @@ def walk(input_item):
         yield item
 
 
+__unary_source = {'-': '(-{})',
+                  '|': 'abs({})'}
+__binary_source = {'+': '({}+{})',
+                   '-': '({}-{})',
+                   '*': '({}*{})',
+                   '/': '({}/{})',
+                   '^': '({}**{})'}
+
+def gen_source(parsed, fields, unary_source=__unary_source,
+               binary_source=__binary_source):
+    """
+    Python source for the expression in parsed, with each of fields as
+    argument v0, v1, ... and numbers as literals
+    """
+    if isinstance(parsed, list):
+        item = parsed[0]
+    else:
+        item = parsed
+    if isinstance(item, UnaryOp):
+        arg = gen_source(item.arg, fields, unary_source, binary_source)
+        return unary_source[item.op].format(arg)
+    elif isinstance(item, BinaryOp):
+        left = gen_source(item.left, fields, unary_source, binary_source)
+        right = gen_source(item.right, fields, unary_source, binary_source)
+        return binary_source[item.op].format(left, right)
+    elif isinstance(item, float):
+        return repr(item)
+    else:
+        return 'v{}'.format(list(fields).index(item))
+
+
+def compile_calc(parsed, fields, factor=None, unary_dict=None,
+                 binary_dict=None):
+    """
+    Compile parsed once into a function of the values of fields (in order),
+    so that evaluating it is a single code object rather than a walk over
+    the parsed tree. A constant factor may be folded in. If unary_dict and
+    binary_dict are given, operators call those functions instead (e.g.
+    for unit calculations).
+    """
+    namespace = {}
+    if unary_dict is None and binary_dict is None:
+        source = gen_source(parsed, fields)
+    else:
+        namespace['_unary'] = unary_dict
+        namespace['_binary'] = binary_dict
+        unary_source = dict((op, '_unary[{!r}]({{}})'.format(op))
+                            for op in unary_dict)
+        binary_source = dict((op, '_binary[{!r}]({{}}, {{}})'.format(op))
+                             for op in binary_dict)
+        source = gen_source(parsed, fields, unary_source, binary_source)
+    if factor is not None and factor != 1.0:
+        source = '({})*{!r}'.format(source, float(factor))
+    args = ', '.join('v{}'.format(i) for i in range(len(fields)))
+    code = compile('lambda {}: {}'.format(args, source), '<extra quantity>',
+                   'eval')
+    return eval(code, namespace)
+
+
+def calc_constant(op, *args):
+    """
+    Value of a unary or binary operation on constants
+    """
+    if len(args) == 1:
+        return __unary_dict[op](*args)
+    return __binary_dict[op](*args)
+
+
+class RegisterCalc():
+    """
+    Evaluates a parsed expression of arrays with NumPy ufuncs, writing every
+    operation through out= into a few scratch buffers (registers) rather
+    than allocating a temporary at each node. Registers are planned once:
+    the side of each operation needing more registers is evaluated first,
+    and registers are freed as soon as they are used, so only a couple are
+    needed whatever the depth of the expression. Long arrays are evaluated
+    histogram.block_rows at a time, so that the registers also stay in
+    cache.
+    Operations on constants only are folded when planning, and a constant
+    factor may be folded in.
+    """
+    def __init__(self, parsed, fields, factor=None):
+        self.fields = list(fields)
+        self.program = []
+        self.n_registers = 0
+        self.free = []
+        result = self.plan(parsed)
+        if factor is not None and factor != 1.0:
+            if result[0] == 'const':
+                result = ('const', result[1] * float(factor))
+            else:
+                result = self.emit('*', [result, ('const', float(factor))])
+        self.result = result
+        del self.free
+
+    def __repr__(self):
+        return 'RegisterCalc({} operations, {} registers)'.format(
+            len(self.program), self.n_registers)
+
+    def need(self, item):
+        """
+        Number of registers needed to evaluate item
+        """
+        if isinstance(item, list):
+            return self.need(item[0])
+        elif isinstance(item, UnaryOp):
+            return max(self.need(item.arg), 1)
+        elif isinstance(item, BinaryOp):
+            left = self.need(item.left)
+            right = self.need(item.right)
+            if left == right:
+                return left + 1
+            return max(left, right)
+        return 0
+
+    def allocate(self):
+        if self.free:
+            return self.free.pop()
+        self.n_registers += 1
+        return self.n_registers - 1
+
+    def emit(self, op, args):
+        """
+        Add an operation on args to the program, with its result in a
+        register (reusing one of the args' registers if possible)
+        """
+        registers = [arg[1] for arg in args if arg[0] == 'reg']
+        if registers:
+            out = registers[0]
+            self.free.extend(registers[1:])
+        else:
+            out = self.allocate()
+        self.program.append((op, args, out))
+        return ('reg', out)
+
+    def plan(self, item):
+        """
+        Plan the evaluation of item, returning where its value will be:
+        ('reg', register), ('arg', field index) or ('const', value)
+        """
+        if isinstance(item, list):
+            return self.plan(item[0])
+        elif isinstance(item, UnaryOp):
+            arg = self.plan(item.arg)
+            if arg[0] == 'const':
+                return ('const', calc_constant(item.op, arg[1]))
+            return self.emit('u' + item.op, [arg])
+        elif isinstance(item, BinaryOp):
+            if self.need(item.right) > self.need(item.left):
+                right = self.plan(item.right)
+                left = self.plan(item.left)
+            else:
+                left = self.plan(item.left)
+                right = self.plan(item.right)
+            if left[0] == 'const' and right[0] == 'const':
+                return ('const', calc_constant(item.op, left[1], right[1]))
+            if item.op == '^' and right == ('const', 2.0):
+                return self.emit('square', [left])
+            if item.op == '^' and right == ('const', 0.5):
+                return self.emit('sqrt', [left])
+            return self.emit(item.op, [left, right])
+        elif isinstance(item, float):
+            return ('const', item)
+        else:
+            return ('arg', self.fields.index(item))
+
+    def __call__(self, *values):
+        import numpy as np
+        from . import histogram
+
+        ufuncs = {'+': np.add, '-': np.subtract, '*': np.multiply,
+                  '/': np.true_divide, '^': np.power, 'u-': np.negative,
+                  'u|': np.absolute, 'square': np.square, 'sqrt': np.sqrt}
+
+        values = [np.asarray(value) for value in values]
+        if self.result[0] == 'const':
+            return self.result[1]
+        shape = np.broadcast(*values).shape
+        dtype = np.result_type(1.0, *values)
+        if self.result[0] == 'arg':
+            # Never hand back the input itself
+            return np.array(values[self.result[1]], dtype=dtype)
+
+        # Work along the first axis in blocks, so that the registers stay in
+        # cache, if every value is either a scalar or of the full shape
+        result = np.empty(shape, dtype)
+        if shape:
+            n = shape[0]
+            rows = histogram.block_rows
+            if rows <= 0 or n <= rows or any(
+                    value.ndim and value.shape != shape for value in values):
+                rows = n
+            blocks = [slice(start, min(start + rows, n))
+                      for start in range(0, max(n, 1), max(rows, 1))]
+            register_shape = (rows,) + shape[1:]
+        else:
+            blocks = [Ellipsis]
+            register_shape = shape
+        registers = [None if i == self.result[1] else
+                     np.empty(register_shape, dtype)
+                     for i in range(self.n_registers)]
+
+        for block in blocks:
+            if block is Ellipsis:
+                block_values = values
+                block_registers = list(registers)
+            else:
+                size = block.stop - block.start
+                block_values = [value[block] if value.ndim else value
+                                for value in values]
+                block_registers = [None if register is None else
+                                   register[:size] for register in registers]
+            # The result is written straight to its place in the output
+            block_registers[self.result[1]] = result[block]
+
+            def get(arg):
+                if arg[0] == 'reg':
+                    return block_registers[arg[1]]
+                elif arg[0] == 'arg':
+                    return block_values[arg[1]]
+                return arg[1]
+
+            for op, args, out in self.program:
+                ufuncs[op](*[get(arg) for arg in args],
+                           out=block_registers[out])
+
+        return result
+
+
 def gen_calc(parsed, translate_values,
              unary_dict=__unary_dict, binary_dict=__binary_dict):
     
@@ -25,13 +25,15 @@ class BackendPDF(BackendMPL):
         
         self.max_auto_resolution = 1024
         self.output_filename = ''
+        self.reuse_figure = True
     
     def init_figure(self):
         """
-        Create the figure
+        Create the figure, once per session: later steps reuse it
         """
-        self.fig = self.Figure()
-        self.canvas = self.FigureCanvas(self.fig)
+        if self.fig is None:
+            self.fig = self.Figure()
+            self.canvas = self.FigureCanvas(self.fig)
     
     def set_output_filename(self, filename):
         """
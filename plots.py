@@ -19,73 +19,23 @@ def plot_fields(x_axis, x_index, y_axis, y_index, render, render_index,
     Plot a 2D histogram plot with one point per grid cell, or
     plot a rendered plot, with optional vector plot
     """
-    from . import __code_name
     from . import limits
     from . import transforms
     from . import plots_interactive
     
     if not backend.interactive:
-        # Loop over all timesteps
+        if getattr(backend, 'parallel', False):
+            # Movie frames, rendered on a pool of processes
+            plot_frames_parallel(x_axis, x_index, y_axis, y_index, render,
+                                 render_index, vector, plot_type, z_slice,
+                                 backend, shared)
+            return
         
-        for i, step in enumerate(shared.sim_step_list):
-            print ('Loading output {}...'.format(step.output_dir))
-            
-            file_no = step.get_output_id()
-            if file_no is None:
-                file_no = i + 1
-            
-            if plot_type == 'render':
-                base_filename = '{}_render_{}_{:05d}'.format(
-                    __code_name.lower(), shared.field_mappings[render].title,
-                    file_no)
-            elif plot_type == 'hist2d':
-                base_filename = '{}_hist2d_{}_{:05d}'.format(
-                    __code_name.lower(), shared.field_mappings[y_axis].title,
-                    file_no)
-            elif plot_type == 'line_plot':
-                base_filename = '{}_grid_{}_{:05d}'.format(
-                    __code_name.lower(), shared.field_mappings[y_axis].title,
-                    file_no)
-            else:
-                base_filename = '{}_{}_{}_{:05d}'.format(
-                    __code_name.lower(), plot_type.properties['file_ext'],
-                    shared.field_mappings[x_axis].title,
-                    file_no)
-            backend.set_output_filename(base_filename)
-            
-            # Find limits
-            plot_limits, data_limits = limits.get_current_limits(
-                x_axis, x_index, y_axis, y_index, render, render_index, vector,
-                plot_type, shared)
-            
-            # Find transforms
-            transform_keys, plot_transforms = transforms.get_plot_transforms(
-                x_axis, y_axis, render, plot_type, shared)
-            
-            cmap = shared.config.get('render', 'cmap')
-            cmap_invert = shared.config.get('render', 'invert')
-            
-            plot_args = {'x_axis': x_axis, 'x_index': x_index,
-                        'y_axis': y_axis, 'y_index': y_index,
-                        'render': render, 'render_index': render_index,
-                        'vector': vector, 'plot_type': plot_type,
-                        'z_slice': z_slice, 'step_no': i,
-                        'cmap': cmap, 'cmap_invert': cmap_invert,
-                        'plot_limits': plot_limits, 'data_limits': data_limits,
-                        'transform_keys': transform_keys,
-                        'plot_transforms': plot_transforms,
-                        'backend': backend, 'shared': shared}
-            
-            data_list, draw_limits, plot_options = single_plot_data(**plot_args)
-            
-            backend.data_list = data_list
-            backend.draw_limits = draw_limits
-            backend.transform_keys = transform_keys
-            backend.plot_transforms = plot_transforms
-            backend.plot_options = plot_options
-            
-            backend.init_figure()
-            backend.plot_data()
+        # Loop over all timesteps
+        for i in range(len(shared.sim_step_list)):
+            plot_step(i, x_axis, x_index, y_axis, y_index, render,
+                      render_index, vector, plot_type, z_slice, backend,
+                      shared)
     
     else:
         # Interactive plot; start with first timestep
@@ -129,6 +79,8 @@ def plot_fields(x_axis, x_index, y_axis, y_index, render, render_index,
         backend.key_press_event = plots_interactive.key_press_interactive
         backend.zoom_main_event = plots_interactive.mouse_zoom_main
         backend.zoom_cbar_event = plots_interactive.mouse_zoom_cbar
+        if hasattr(backend, 'call_in_gui'):
+            backend.loader = plots_interactive.BackgroundLoader(backend)
         
         backend.data_list = data_list
         backend.draw_limits = draw_limits
@@ -143,18 +95,215 @@ def plot_fields(x_axis, x_index, y_axis, y_index, render, render_index,
     return
 
 
-def plot_time(axis, index, time_operation, backend, shared):
+def plot_step(i, x_axis, x_index, y_axis, y_index, render, render_index,
+              vector, plot_type, z_slice, backend, shared, plot_limits=None,
+              file_no=None):
     """
-    Create simple line plot of properties against time
+    Plot one step to a file backend, with the current limits unless plot
+    limits are given; frames are numbered by output unless file_no is given.
+    Returns the draw limits, plot transforms and plot options of the plot.
+    """
+    from . import __code_name
+    from . import limits
+    from . import transforms
+    
+    step = shared.sim_step_list[i]
+    print ('Loading output {}...'.format(step.output_dir))
+    
+    if file_no is None:
+        file_no = step.get_output_id()
+    if file_no is None:
+        file_no = i + 1
+    
+    if plot_type == 'render':
+        base_filename = '{}_render_{}_{:05d}'.format(
+            __code_name.lower(), shared.field_mappings[render].title,
+            file_no)
+    elif plot_type == 'hist2d' and render is not None:
+        base_filename = '{}_hist2d_{}_{}_{:05d}'.format(
+            __code_name.lower(), shared.field_mappings[y_axis].title,
+            shared.field_mappings[render].title, file_no)
+    elif plot_type == 'hist2d':
+        base_filename = '{}_hist2d_{}_{:05d}'.format(
+            __code_name.lower(), shared.field_mappings[y_axis].title,
+            file_no)
+    elif plot_type == 'line_plot':
+        base_filename = '{}_grid_{}_{:05d}'.format(
+            __code_name.lower(), shared.field_mappings[y_axis].title,
+            file_no)
+    else:
+        base_filename = '{}_{}_{}_{:05d}'.format(
+            __code_name.lower(), plot_type.properties['file_ext'],
+            shared.field_mappings[x_axis].title,
+            file_no)
+    backend.set_output_filename(base_filename)
+    
+    # Find limits
+    current_limits, data_limits = limits.get_current_limits(
+        x_axis, x_index, y_axis, y_index, render, render_index, vector,
+        plot_type, shared)
+    if plot_limits is None:
+        plot_limits = current_limits
+    
+    # Find transforms
+    transform_keys, plot_transforms = transforms.get_plot_transforms(
+        x_axis, y_axis, render, plot_type, shared)
+    
+    cmap = shared.config.get('render', 'cmap')
+    cmap_invert = shared.config.get('render', 'invert')
+    
+    plot_args = {'x_axis': x_axis, 'x_index': x_index,
+                'y_axis': y_axis, 'y_index': y_index,
+                'render': render, 'render_index': render_index,
+                'vector': vector, 'plot_type': plot_type,
+                'z_slice': z_slice, 'step_no': i,
+                'cmap': cmap, 'cmap_invert': cmap_invert,
+                'plot_limits': plot_limits, 'data_limits': data_limits,
+                'transform_keys': transform_keys,
+                'plot_transforms': plot_transforms,
+                'backend': backend, 'shared': shared}
+    
+    data_list, draw_limits, plot_options = single_plot_data(**plot_args)
+    
+    backend.data_list = data_list
+    backend.draw_limits = draw_limits
+    backend.transform_keys = transform_keys
+    backend.plot_transforms = plot_transforms
+    backend.plot_options = plot_options
+    
+    backend.init_figure()
+    backend.plot_data()
+    
+    return draw_limits, plot_transforms, plot_options
+
+
+# Settings for plot_movie_frame, set before the worker processes are forked
+movie_settings = {}
+
+
+def plot_movie_frame(i):
+    """
+    Plot frame i of a movie, in a worker process with its own canvas
+    """
+    args = movie_settings['args']
+    shared = args[-1]
+    
+    # Worker processes cannot start their own pools
+    shared.config.set('opts', 'multiprocessing', 'off')
+    plot_step(i, *args, plot_limits=movie_settings['plot_limits'],
+              file_no=i+1)
+    
+    return movie_settings['backend'].output_filename
+
+
+def get_movie_limits(plot_limits, draw_limits, plot_transforms,
+                     plot_options, clim=None):
+    """
+    Plot limits for every frame of a movie: any 'auto' limits of the
+    quantities plotted are fixed at those drawn on the first frame, as are
+    the colour limits (clim) of a 2D histogram
+    """
+    from . import transforms
+    
+    movie_limits = dict((key, list(value))
+                        for key, value in plot_limits.items())
+    
+    axes = []
+    if not plot_options.get('x_pos', True):
+        axes.append(('x_axis', draw_limits['xy_limits'][0],
+                     plot_transforms['x_transform']))
+    if not plot_options.get('y_pos', True):
+        axes.append(('y_axis', draw_limits['xy_limits'][1],
+                     plot_transforms['y_transform']))
+    if plot_options['plot_type'] == 'render':
+        axes.append(('render', draw_limits['render'],
+                     plot_transforms['render_transform']))
+    
+    for key, drawn, transform in axes:
+        drawn = transforms.apply_transform(transform, drawn, inverse=True)
+        for j in range(2):
+            if movie_limits[key][j] == 'auto':
+                movie_limits[key][j] = float(drawn[j])
+    
+    if plot_options['plot_type'] == 'hist2d' and clim is not None:
+        movie_limits['hist2d_clim'] = [float(c) for c in clim]
+    
+    return movie_limits
+
+
+def plot_frames_parallel(x_axis, x_index, y_axis, y_index, render,
+                         render_index, vector, plot_type, z_slice, backend,
+                         shared):
+    """
+    Plot a numbered frame for every step, on a pool of processes. The first
+    frame is plotted first, to fix any adaptive limits for all the others,
+    so that every frame has the same scales.
+    """
+    from . import limits
+    import multiprocessing
+    
+    nstep = len(shared.sim_step_list)
+    args = (x_axis, x_index, y_axis, y_index, render, render_index, vector,
+            plot_type, z_slice, backend, shared)
+    
+    # First frame, setting the limits of the others
+    plot_limits = limits.get_current_limits(
+        x_axis, x_index, y_axis, y_index, render, render_index, vector,
+        plot_type, shared)[0]
+    draw_limits, plot_transforms, plot_options = plot_step(
+        0, *args, file_no=1)
+    frame_filenames = [backend.output_filename]
+    movie_limits = get_movie_limits(plot_limits, draw_limits,
+                                    plot_transforms, plot_options,
+                                    getattr(backend, 'current_clim', None))
+    
+    movie_settings.update({'args': args, 'plot_limits': movie_limits,
+                           'backend': backend})
+    processes = min(nstep - 1, multiprocessing.cpu_count())
+    try:
+        if processes > 1:
+            # Workers see movie_settings (and compiled extra quantities,
+            # which cannot be pickled) by being forked
+            if hasattr(multiprocessing, 'get_context'):
+                pool = multiprocessing.get_context('fork').Pool(processes)
+            else:
+                pool = multiprocessing.Pool(processes)
+            try:
+                frame_filenames.extend(
+                    pool.map(plot_movie_frame, range(1, nstep), 1))
+                pool.close()
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            for i in range(1, nstep):
+                plot_step(i, *args, plot_limits=movie_limits, file_no=i+1)
+                frame_filenames.append(backend.output_filename)
+    finally:
+        movie_settings.clear()
+    
+    backend.write_movie(frame_filenames)
+
+
+def plot_time(time_series, backend, shared):
+    """
+    Create simple line plot of properties against time. time_series is a
+    list of (axis, index, time_operation); several series are plotted in
+    stacked panels, the last being the main (zoomable) one.
     """
     from . import __code_name
     from . import limits
     from . import transforms
     from . import plots_interactive
     
+    axis, index, time_operation = time_series[-1]
+    
     # Find limits
     plot_limits, data_limits = limits.get_current_limits(
         None, None, axis, index, None, None, None, 'time', shared)
+    # Time plots start from the range of the results, not the field limits
+    plot_limits['x_axis'] = ['auto', 'auto']
+    plot_limits['y_axis'] = ['auto', 'auto']
     
     # Find transforms
     transform_keys, plot_transforms = transforms.get_plot_transforms(
@@ -172,12 +321,15 @@ def plot_time(axis, index, time_operation, backend, shared):
                  'backend': backend, 'shared': shared}
     
     if not backend.interactive:
-        base_filename = '{}_{}_{}'.format(__code_name.lower(),
-                                        shared.field_mappings[axis].title,
-                                        time_operation[1])
+        name_parts = [__code_name.lower()]
+        for series_axis, series_index, series_operation in time_series:
+            name_parts.append(shared.field_mappings[series_axis].title)
+            name_parts.append(series_operation[1])
+        base_filename = '_'.join(name_parts)
         backend.set_output_filename(base_filename)
     
     plot_args['time_operation'] = time_operation
+    plot_args['time_series'] = time_series
     #plot_args['weight'] = weight
     
     data_list, draw_limits, plot_options = time_plot_wrapper(**plot_args)
@@ -191,6 +343,8 @@ def plot_time(axis, index, time_operation, backend, shared):
         backend.key_press_event = plots_interactive.key_press_interactive
         backend.zoom_main_event = plots_interactive.mouse_zoom_main
         backend.zoom_cbar_event = plots_interactive.mouse_zoom_cbar
+        if hasattr(backend, 'call_in_gui'):
+            backend.loader = plots_interactive.BackgroundLoader(backend)
     
     backend.data_list = data_list
     backend.draw_limits = draw_limits
@@ -208,64 +362,190 @@ def time_plot_wrapper(**plot_args):
     Wrap up single_plot_data; run over each step and collate the results
     Note this is very slightly badly behaved function! It both returns
     a value and makes (minor) alterations to plot_args
+
+    Each step is read once for all time series, with the reductions for
+    every series accumulated together; the results go in one column per
+    series. Results for each step are kept in an on-disk cache, so that
+    only new (or rewritten) outputs are reduced; with use_old_data, the
+    previous results are simply redrawn.
     """
+    from . import analysis
+    from . import time_cache
+    from . import menu_units
     import numpy as np
     
     shared = plot_args['shared']
+    backend = plot_args['backend']
     nstep = len(shared.sim_step_list)
+    time_series = plot_args['time_series']
+    nseries = len(time_series)
     
-    time_data = np.zeros((nstep, 2))
-    
-    for i, step in enumerate(shared.sim_step_list):
-        print ('Loading output {}...'.format(step.output_dir))
-        step.load_dataset()
+    if plot_args.get('use_old_data', False):
+        time_data = backend.data_list[0]
+        plot_options = backend.plot_options
+    else:
+        # Settings for each series, which determine the result for each
+        # output; the main axis may have had its transform changed
+        time_unit = menu_units.get_unit(shared, 'time')[0]
+        series_info = []
+        for axis, index, time_operation in time_series:
+            fm = shared.field_mappings[axis]
+            unit, unit_str = menu_units.get_unit(shared, '_'+fm.field.name)
+            if axis == plot_args['y_axis']:
+                transform_key = plot_args['transform_keys']['y_transform']
+                transform = plot_args['plot_transforms']['y_transform']
+            else:
+                transform_key = shared.config.get_safe('transforms', fm.title)
+                if transform_key is None:
+                    transform = None
+                else:
+                    transform = shared.transform_dict[transform_key]
+            # Extras are keyed with other extras substituted, so that
+            # redefining a quantity they use changes their key too
+            if fm.field.extra_expanded is not None:
+                extra = str(fm.field.extra_expanded)
+            else:
+                extra = fm.extra
+            settings = [fm.field.name, extra, index, time_operation[1],
+                        shared.config.get('opts', 'weighting'),
+                        repr(plot_args['data_limits']),
+                        shared.config.get_safe('data', 'use_units'),
+                        unit, time_unit, transform_key]
+            label = fm.title + unit_str
+            if transform_key is not None:
+                label = transform_key.replace('x', label)
+            series_info.append({'field': fm.field, 'index': index,
+                                'unit': unit, 'transform': transform,
+                                'operation': time_operation,
+                                'settings': settings,
+                                'label': time_operation[1] + ' ' + label})
         
-        # load data
-        if i==0:
-            plot_args['plot_options'] = None
-        else:
-            plot_args['plot_options'] = plot_options
+        # Each distinct quantity is read once, whatever the operations
+        quantities = []
+        for info in series_info:
+            quantity = (info['field'], info['index'], info['unit'],
+                        info['transform'])
+            if quantity not in quantities:
+                quantities.append(quantity)
+            info['column'] = quantities.index(quantity)
         
-        plot_args['step_no'] = i
+        cache = time_cache.TimeSeriesCache(shared)
         
-        data_list, plot_options = single_plot_data(**plot_args)
+        time_data = np.zeros((nstep, nseries+1))
+        plot_options = None
         
-        time, cell_data, weights = data_list
-        #if not plot_args['weight']:
-            #weights = np.ones_like(cell_data)
+        try:
+            for i, step in enumerate(shared.sim_step_list):
+                keys = [time_cache.get_time_key(step, info['settings'])
+                        for info in series_info]
+                cached = [cache.get(key) for key in keys]
+                if all(result is not None for result in cached):
+                    time_data[i, 0] = cached[0][0]
+                    time_data[i, 1:] = [result[1] for result in cached]
+                    continue
+                
+                print ('Loading output {}...'.format(step.output_dir))
+                step.load_dataset()
+                
+                # load data
+                plot_args['plot_options'] = plot_options
+                plot_args['step_no'] = i
+                
+                data_list, plot_options = single_plot_data(**plot_args)
+                time = data_list[0]
+                
+                # Reduce one chunk of cells at a time, for every series
+                reductions = [info['operation'][2]() for info in series_info]
+                cell_chunks = analysis.iter_multi_data(
+                    [quantity[0] for quantity in quantities],
+                    [quantity[1] for quantity in quantities],
+                    [quantity[2] for quantity in quantities],
+                    [quantity[3] for quantity in quantities],
+                    plot_args['data_limits'], step, shared)
+                for cell_data, weights_list in cell_chunks:
+                    for info, reduction in zip(series_info, reductions):
+                        column = info['column']
+                        reduction.update(cell_data[:, column],
+                                         weights_list[column])
+                
+                time_data[i, 0] = time
+                for j, (key, reduction) in enumerate(zip(keys, reductions)):
+                    time_data[i, j+1] = reduction.result()
+                    cache.set(key, time_data[i, 0], time_data[i, j+1])
+                del data_list
+                del cell_chunks
+        finally:
+            # Write the new results, even if interrupted
+            cache.flush()
         
-        single_result = plot_args['time_operation'][2](cell_data, weights)
-        time_data[i, 0] = time
-        time_data[i, 1] = single_result
-        del data_list
-        del cell_data
-        del weights
-
-    plot_args['step_no'] = None
+        if plot_options is None:
+            # Every step was cached; plot options from the first step only
+            plot_args['plot_options'] = None
+            plot_args['step_no'] = 0
+            data_list, plot_options = single_plot_data(**plot_args)
+            del data_list
+        if nseries > 1:
+            plot_options['series_labels'] = [info['label']
+                                             for info in series_info]
+            plot_options['ylabel'] = series_info[-1]['label']
+        plot_args['plot_options'] = plot_options
+        plot_args['step_no'] = None
     
-    tmin = min(time_data[:, 0])
-    tmax = max(time_data[:, 0])
-    qmin = min(time_data[:, 1])
-    qmax = max(time_data[:, 1])
+    # Limits from the main (last) series
+    min_max_data = {'x_min': min(time_data[:, 0]),
+                    'x_max': max(time_data[:, 0]),
+                    'y_min': min(time_data[:, -1]),
+                    'y_max': max(time_data[:, -1])}
     
     draw_limits = dict(plot_args['plot_limits'])
-    draw_limits['xy_limits'] = [[tmin, tmax], [qmin, qmax]]
+    draw_limits['xy_limits'] = analysis.get_xy_limits(
+        draw_limits, min_max_data, plot_args['plot_transforms']['x_transform'],
+        plot_args['plot_transforms']['y_transform'])
     
     return [time_data], draw_limits, plot_options
 
 
-def update_plot_data(backend, use_old_data=False):
+def update_plot_data(backend, use_old_data=False, load_step=False):
     """
     Reload data and replot, under the assumption that the saved data in backend
-    has been changed or updated
+    has been changed or updated. With load_step, the output of the current
+    step is loaded first. Backends with a background loader get the data in
+    its worker thread.
+    """
+    loader = getattr(backend, 'loader', None)
+    if loader is not None:
+        loader.request(use_old_data, load_step)
+        return
+    
+    set_plot_data(backend, get_plot_data(backend.plot_args, use_old_data,
+                                         load_step))
+
+
+def get_plot_data(plot_args, use_old_data=False, load_step=False):
+    """
+    Get the data for the plot described by plot_args, as (data_list,
+    draw_limits, plot_options)
     """
-    plot_args = dict(backend.plot_args)
+    from . import analysis
+    plot_args = dict(plot_args)
     plot_args['use_old_data'] = use_old_data
     
-    if backend.plot_args['plot_type'] == 'time':
-        (data_list, draw_limits, plot_options) = time_plot_wrapper(**plot_args)
+    if load_step:
+        step = plot_args['shared'].sim_step_list[plot_args['step_no']]
+        step.load_dataset()
+        analysis.check_cancelled()
+    
+    if plot_args['plot_type'] == 'time':
+        return time_plot_wrapper(**plot_args)
     else:
-        (data_list, draw_limits, plot_options) = single_plot_data(**plot_args)
+        return single_plot_data(**plot_args)
+
+
+def set_plot_data(backend, plot_data):
+    """
+    Store new data in the backend and replot
+    """
+    (data_list, draw_limits, plot_options) = plot_data
     
     backend.data_list = data_list
     backend.draw_limits = draw_limits
@@ -353,6 +633,15 @@ def single_plot_data(x_axis, x_index, y_axis, y_index, render, render_index,
         plot_options = {}
         plot_options['data_axis'] = None
         plot_options['sink_data'] = None
+        plot_options['time_unit'] = time_unit_str
+        plot_options['fields'] = {}
+        for key, axis, unit_str in (('x', x_axis, x_unit_str),
+                                    ('y', y_axis, y_unit_str),
+                                    ('render', render, render_unit_str)):
+            if axis is not None:
+                plot_options['fields'][key] = {
+                    'title': shared.field_mappings[axis].title,
+                    'unit': unit_str.strip(' []')}
         #plot_options['title'] = 'Plot title here'
         if x_axis is not None:
             x_fm_title = shared.field_mappings[x_axis].title
@@ -389,9 +678,19 @@ def single_plot_data(x_axis, x_index, y_axis, y_index, render, render_index,
                 plot_options['cmap'] = cmap
             if plot_type == 'hist2d':
                 plot_options['colourbar'] = True
-                plot_options['colourbar_label'] = 'Frequency density'
+                if render is not None:
+                    # Coloured by a binned statistic of a third quantity
+                    plot_options['colourbar_label'] = '{} {}{}'.format(
+                        shared.config.get('opts', 'hist2d_statistic'),
+                        shared.field_mappings[render].title,
+                        render_unit_str)
+                else:
+                    plot_options['colourbar_label'] = (
+                        'Frequency density ({} weighted)'.format(
+                            shared.config.get('opts', 'weighting')))
                 if plot_transforms['hist_transform'] is None:
-                    plot_options['colourbar_ticks'] = [0.0]
+                    if render is None:
+                        plot_options['colourbar_ticks'] = [0.0]
                 else:
                     plot_options['colourbar_label'] = (
                         transform_keys['hist_transform'].replace(
@@ -481,6 +780,8 @@ def single_plot_data(x_axis, x_index, y_axis, y_index, render, render_index,
         else:
             resolution = int(resolution)
         plot_options['resolution'] = resolution
+        plot_options['mipmap'] = shared.config.get_safe('render', 'mipmap',
+                                                        'mean')
         
         # Deal with sink data, if present and if we are using it
         if plot_type == 'render':
@@ -530,6 +831,7 @@ def single_plot_data(x_axis, x_index, y_axis, y_index, render, render_index,
                 plot_options['sink_options'] = sink_options
     
     # We now have a set of plot options (cached or newly created), set up plots
+    plot_options['time'] = time
     x_pos = plot_options['x_pos']
     y_pos = plot_options['y_pos']
     box_length = plot_options['box_length']
@@ -586,12 +888,20 @@ def single_plot_data(x_axis, x_index, y_axis, y_index, render, render_index,
             data_list_pass = backend.data_list
         else:
             data_list_pass = None
+        # Keep a base histogram to rebin zooms from, if interactive
+        keep_base = getattr(backend, 'interactive', False)
+        if keep_base and getattr(backend, 'plot_type', None) == 'hist2d':
+            base_pass = backend.data_list[4]
+        else:
+            base_pass = None
         # Data from analysis function
         data_list, xy_limits = analysis.get_histogram2d(
             x_field, x_index, x_unit, x_pos,
             y_field, y_index, y_unit, y_pos,
             resolution, plot_transforms,
-            draw_limits, data_limits, step, shared, data_list_pass)
+            draw_limits, data_limits, step, shared, data_list_pass,
+            keep_base, base_pass, render_field, render_index, render_unit,
+            shared.config.get('opts', 'hist2d_statistic'))
         
         draw_limits['xy_limits'] = xy_limits
         plot_options['plot_type'] = 'hist2d'
@@ -636,14 +946,10 @@ def single_plot_data(x_axis, x_index, y_axis, y_index, render, render_index,
         
         ret_tuple = (data_list, draw_limits, plot_options)
     elif plot_type == 'time':
-        # Data from analysis function
-        cell_data, weights = analysis.get_single_data(
-            y_field, y_index, y_unit, plot_transforms['y_transform'],
-            data_limits, step, shared)
-        
+        # Only the time; time_plot_wrapper reduces the cell data
         plot_options['plot_type'] = 'time'
         
-        ret_tuple = ([time, cell_data, weights], plot_options)
+        ret_tuple = ([time], plot_options)
     else:
         # Data for general-purpose analysis function; see get_analysis_list
         # in analysis.py
@@ -658,6 +964,18 @@ def single_plot_data(x_axis, x_index, y_axis, y_index, render, render_index,
             data_array, weights = analysis.get_box_data(
                 x_field, x_index, x_unit, resolution,
                 plot_transforms['x_transform'], data_limits, step, shared)
+        
+        elif plot_type.properties['data_type'] == 'vector_sample_data':
+            
+            data_array, weights = analysis.get_box_vector_data(
+                x_field, x_unit, resolution, data_limits, step, shared)
+        
+        elif plot_type.properties['data_type'] == 'radial_cell_data':
+            
+            # Chunks of cells in the profile sphere, and the radial bins
+            data_array, weights = analysis.get_radial_data(
+                x_field, x_index, x_unit, plot_transforms['x_transform'],
+                data_limits, step, shared)
         else:
             raise ValueError('Unknown plot type!')
         
@@ -670,6 +988,8 @@ def single_plot_data(x_axis, x_index, y_axis, y_index, render, render_index,
             plot_options['title'] = props['title']
         if 'xlabel' in props:
             plot_options['xlabel'] = props['xlabel']
+        if props['data_type'] == 'radial_cell_data':
+            plot_options['xlabel'] = props['xlabel'] + position_unit_str
         if 'xticks' in props:
             plot_options['xticks'] = props['xticks']
         if 'ylabel' in props:
@@ -15,6 +15,120 @@ class KeyOption():
         self.info = info
 
 
+class BackgroundLoader():
+    """
+    Get the data for plot updates in a worker thread, so that the window
+    keeps responding. Loads run one at a time, each of the latest plot
+    arguments, so that repeated keypresses and zooms are coalesced into one
+    update. A request that needs new data cancels the running load; one
+    that reuses the old data (e.g. a colour map change) waits for it, and is
+    then applied to its result. Results are applied on the GUI thread,
+    through the backend's call_in_gui.
+    """
+    def __init__(self, backend):
+        self.backend = backend
+        # Cancel event of the running load, or None
+        self.running = None
+        # (use_old_data, load_step) of requests since the running load
+        # started, or None
+        self.flags = None
+    
+    @staticmethod
+    def merge_flags(first, second):
+        """
+        Flags of two requests loaded as one: old data can only be reused if
+        neither needs new data
+        """
+        if first is None:
+            return second
+        if second is None:
+            return first
+        return (first[0] and second[0], first[1] or second[1])
+    
+    def request(self, use_old_data=False, load_step=False):
+        """
+        Request an update of the plot to the current plot arguments
+        """
+        self.flags = self.merge_flags(self.flags, (use_old_data, load_step))
+        
+        if self.running is None:
+            self.backend.set_busy(True)
+            self.start()
+        elif not self.flags[0]:
+            # The running load is stale; restart when it stops
+            self.running.set()
+    
+    def cancel(self):
+        """
+        Cancel the running load and drop pending requests
+        """
+        self.flags = None
+        if self.running is not None:
+            self.running.set()
+    
+    def start(self):
+        """
+        Start a load of the current plot arguments
+        """
+        import threading
+        
+        # Copy the plot arguments, which key handlers change in place
+        plot_args = dict(self.backend.plot_args)
+        for key, value in plot_args.items():
+            if isinstance(value, dict):
+                plot_args[key] = dict(value)
+        
+        load_flags = self.flags
+        self.flags = None
+        self.running = threading.Event()
+        thread = threading.Thread(
+            target=self.run, args=(plot_args, load_flags, self.running))
+        thread.daemon = True
+        thread.start()
+    
+    def run(self, plot_args, load_flags, cancel):
+        """
+        Get the data in the worker thread, and pass it to the GUI thread
+        """
+        import traceback
+        from . import analysis
+        from . import plots
+        
+        analysis.cancel_state.event = cancel
+        plot_data = None
+        error = None
+        try:
+            plot_data = plots.get_plot_data(plot_args, *load_flags)
+        except analysis.LoadCancelled:
+            pass
+        except Exception:
+            error = traceback.format_exc()
+        self.backend.call_in_gui(self.finish, load_flags, cancel, plot_data,
+                                 error)
+    
+    def finish(self, load_flags, cancel, plot_data, error):
+        """
+        Show the result of a load, unless it was cancelled, and start the
+        next load if there have been requests since
+        """
+        from . import plots
+        
+        self.running = None
+        if cancel.is_set():
+            if self.flags is not None:
+                # Superseded, so its update is still to be shown
+                self.flags = self.merge_flags(load_flags, self.flags)
+        elif error is not None:
+            print(error)
+        else:
+            plots.set_plot_data(self.backend, plot_data)
+        
+        if self.flags is not None:
+            self.start()
+        else:
+            self.backend.set_busy(False)
+
+
 def init_key_dict(backend):
     """
     Define the key press dictionary for this backend
@@ -63,8 +177,12 @@ def init_key_dict(backend):
     key_dict['F'] = render_opt
     key_dict['i'] = KeyOption('i', 'Invert colour scheme', key_cbar_invert)
     
+    backend.key_dicts['render'] = dict(**key_dict)
+    
+    key_dict['w'] = KeyOption('w', 'Step through histogram weightings',
+                              key_weighting)
+    
     backend.key_dicts['hist2d'] = key_dict
-    backend.key_dicts['render'] = key_dict
 
 
 def key_press_interactive(backend, key, axes_name, x, y):
@@ -94,7 +212,8 @@ def mouse_zoom_main(backend, xlim, ylim):
     else:
         backend.plot_args['plot_limits']['y_axis'] = y_transform[1](ylim)
     config = backend.plot_args['shared'].config
-    plots.update_plot_data(backend)
+    # Time plot results do not depend on the plot limits
+    plots.update_plot_data(backend, backend.plot_type == 'time')
 
 
 def mouse_zoom_cbar(backend, clim):
@@ -131,7 +250,7 @@ def key_log(backend, axes_name, *args):
     Toggle the current plot, if a rendered plot, between log10 and not log10
     """
     from . import plots
-    from numpy import log10, frompyfunc
+    from numpy import log10
     plot_type = backend.plot_options['plot_type']
     data_axis = backend.plot_options['data_axis']
     plot_transforms = backend.plot_transforms
@@ -175,14 +294,38 @@ def key_log(backend, axes_name, *args):
         plot_transforms[key] = None
         print('Non-logarithmic')
     else:
-        ten_to = frompyfunc(lambda x: 10.0**x, 1, 1)
+        transform_dict = backend.plot_args['shared'].transform_dict
         transform_keys[key] = 'log(x)'
-        plot_transforms[key] = (log10, ten_to)
+        plot_transforms[key] = transform_dict['log(x)']
         print('Logarithmic')
         
     plots.update_plot_data(backend)
 
 
+def key_weighting(backend, axes_name, x, y, key, info):
+    """
+    Step through the weightings of 2D histograms; histograms of cell data
+    hold every weighting, so need no rereading
+    """
+    from . import plots
+    from . import analysis
+    from . import histogram
+    config = backend.plot_args['shared'].config
+    weightings = analysis.hist_weightings
+    weighting = config.get('opts', 'weighting')
+    if weighting in weightings:
+        weighting = weightings[(weightings.index(weighting) + 1) %
+                               len(weightings)]
+    else:
+        weighting = weightings[0]
+    config.set('opts', 'weighting', weighting)
+    print(" >> Weighting set to '{}'".format(weighting))
+    
+    use_old_data = isinstance(backend.data_list[5],
+                              histogram.MultiWeightHistogram2D)
+    plots.update_plot_data(backend, use_old_data)
+
+
 def key_save(backend, axes_name, x, y, key, info):
     """
     Save details of plot (and possibly limits) to memory
@@ -205,6 +348,10 @@ def key_save(backend, axes_name, x, y, key, info):
     vector = plot_args['vector']
     plot_limits = plot_args['plot_limits']
     shared = plot_args['shared']
+    if plot_type == 'hist2d':
+        # The colourbar of a 2D histogram shows (transformed) counts or a
+        # binned statistic of the colour field, not limits of that field
+        render = None
     x_transform = backend.plot_transforms['x_transform']
     y_transform = backend.plot_transforms['y_transform']
     render_transform = backend.plot_transforms['render_transform']
@@ -225,12 +372,16 @@ def key_save(backend, axes_name, x, y, key, info):
         plot_limits['y_axis'] = ylim
         print('Plot options and y axis limits saved to memory')
     elif axes_name == 'cbar':
-        plot_limits['render'] = rlim
-        print('Plot options and colourbar limits saved to memory')
+        if render is None:
+            print('Plot options saved to memory; colourbar limits of 2D '
+                  'histograms are not saved')
+        else:
+            plot_limits['render'] = rlim
+            print('Plot options and colourbar limits saved to memory')
     else:
         plot_limits['x_axis'] = xlim
         plot_limits['y_axis'] = ylim
-        if plot_args['render'] is not None:
+        if render is not None:
             plot_limits['render'] = rlim
         print('Plot options and limits saved to memory')
     
@@ -270,11 +421,10 @@ def key_next_prev(backend, axes_name, x, y, key, info):
         
         step = backend.plot_args['shared'].sim_step_list[step_no]
         print ('Loading output {}...'.format(step.output_dir))
-        step.load_dataset()
         
         backend.plot_args['step_no'] = step_no
         
-        plots.update_plot_data(backend)
+        plots.update_plot_data(backend, load_step=True)
     backend.zoom_factor = 1
     backend.zoom_mult = 1
 
@@ -527,7 +677,7 @@ def key_zoom(backend, axes_name, x, y, key, info):
         backend.zoom_factor = 1
         backend.zoom_mult = 1
         
-    plots.update_plot_data(backend, zoom_c)
+    plots.update_plot_data(backend, zoom_c or backend.plot_type == 'time')
     
     
     
@@ -64,6 +64,18 @@ def get_output_id(output_dir):
     return output_number
 
 
+def get_output_mtime(output_dir):
+    """
+    Find the latest modification time of the files in an output directory
+    """
+    mtime = os.path.getmtime(output_dir)
+    for filename in os.listdir(output_dir):
+        mtime = max(mtime, os.path.getmtime(os.path.join(output_dir,
+                                                         filename)))
+
+    return mtime
+
+
 def load_output(output_dir):
     import ast
     import warnings
@@ -296,7 +308,8 @@ def create_field_list(fields):
         if field.extra is None:
             field_set.add(field.name)
         else:
-            field_set.update(extra_quantities.get_field_names(field.extra))
+            field_set.update(
+                extra_quantities.get_field_names(field.extra_expanded))
     
     # We don't want 'position' in our field_list
     field_set.discard('position')
@@ -308,10 +321,36 @@ def create_field_list(fields):
     return field_list
 
 
-def get_cell_data(x_field, x_index, y_field, y_index,
-                  data_limits, step, shared):
+def check_cancelled():
     """
-    Obtain cell data for x_axis and y_axis, filtering with data_limits
+    Raise analysis.LoadCancelled if the data load of this thread has been
+    cancelled; checked before each chunk of cells and each map
+    """
+    from . import analysis
+    analysis.check_cancelled()
+
+
+def get_cell_weights(cells, ndim, weighting):
+    """
+    Weights of cells for a weighting of 'count', 'volume' or 'mass'
+    """
+    if weighting == 'count':
+        return np.ones(cells.npoints)
+    volumes = cells.get_sizes()**ndim
+    if weighting == 'mass':
+        return volumes * cells['rho']
+    return volumes
+
+
+def iter_cell_data(x_field, x_index, y_field, y_index,
+                   data_limits, step, shared, weightings=None):
+    """
+    Iterate over cell data for x_axis and y_axis, filtering with data_limits.
+    Yields (data_array, weights) one chunk of cells (one pymses dataset) at
+    a time, so that the full set of cells is never held in memory.
+
+    By default weights follow the weighting option; if a list of weightings
+    is given, weights has one column for each instead.
     """
     from . import extra_quantities
 
@@ -338,10 +377,16 @@ def get_cell_data(x_field, x_index, y_field, y_index,
     
     field_list = create_field_list(fields)
     
-    mass_weighted = (shared.config.get('opts', 'weighting') == 'mass')
-    if y_field.name == 'rho':
-        mass_weighted = False
-    if mass_weighted and not 'rho' in field_list:
+    if weightings is None:
+        weightings = [shared.config.get('opts', 'weighting')]
+        single_weighting = True
+    else:
+        single_weighting = False
+    if y_field is not None and y_field.name == 'rho':
+        # Density is never mass weighted
+        weightings = ['volume' if weighting == 'mass' else weighting
+                      for weighting in weightings]
+    if 'mass' in weightings and not 'rho' in field_list:
         field_list.append('rho')
     
     # Load data, running through box filter and then creating point dataset
@@ -353,11 +398,9 @@ def get_cell_data(x_field, x_index, y_field, y_index,
     # Now, construct function filter stack
     filter_stack = function_filter_stack(cell_source, data_limits)
     
-    data_array_list = []
-    weights_list = []
-    
     # Flatten and calculate
     for cells in filter_stack[-1].iter_dsets():
+        check_cancelled()
     
         # Collect data
         if x_field is None and y_field is None:
@@ -373,39 +416,182 @@ def get_cell_data(x_field, x_index, y_field, y_index,
     
         if cells.npoints > 0:
             if x_field is not None:
-                if x_field.extra is not None:
-                    x_data_view[:] = extract_cell_func(x_field, cells)()
-                elif x_pos:
-                    x_data_view[:] = cells.points[:, x_index]
-                else:
-                    scalar = (cells[x_field.name].ndim == 1)
-                    if scalar:
-                        x_data_view[:] = cells[x_field.name]
-                    else:
-                        x_data_view[:] = cells[x_field.name][:, x_index]
-            
+                fill_cell_data(x_data_view, x_field, x_index, cells)
             if y_field is not None:
-                if y_field.extra is not None:
-                    y_data_view[:] = extract_cell_func(y_field, cells)()
-                elif y_pos:
-                    y_data_view[:] = cells.points[:, y_index]
-                else:
-                    scalar = (cells[y_field.name].ndim == 1)
-                    if scalar:
-                        y_data_view[:] = cells[y_field.name]
-                    else:
-                        y_data_view[:] = cells[y_field.name][:, y_index]
+                fill_cell_data(y_data_view, y_field, y_index, cells)
         
-        data_array_list.append(temp_data_array)
+        if single_weighting:
+            weights = get_cell_weights(cells, ndim, weightings[0])
+        else:
+            weights = np.column_stack(
+                [get_cell_weights(cells, ndim, weighting)
+                 for weighting in weightings])
+        
+        cells = None
+        
+        yield temp_data_array, weights
+    
+    step.data_set = None
+
+
+def iter_multi_cell_data(fields, indices, data_limits, step, shared):
+    """
+    Iterate over cell data for several fields at once, filtering with
+    data_limits. Yields (data_array, weights_list) one chunk of cells at a
+    time, where data_array has one column per field and weights_list holds
+    the weights for each field (density is never mass weighted).
+    """
+    
+    ndim = shared.ndim
+    
+    # If we are going to filter on a field, we need it!
+    field_list = create_field_list(
+        list(fields) + [limit['field'] for limit in data_limits])
+    
+    weighting = shared.config.get('opts', 'weighting')
+    if weighting == 'mass' and not 'rho' in field_list:
+        field_list.append('rho')
+    
+    # Load data, running through box filter and then creating point dataset
+    amr = step.data_set.amr_source(field_list)
+    region = get_region_filter(data_limits, step)
+    amr_region = pymses.filters.RegionFilter(region, amr)
+    cell_source = pymses.filters.CellsToPoints(amr_region)
+    
+    # Now, construct function filter stack
+    filter_stack = function_filter_stack(cell_source, data_limits)
+    
+    # Flatten and calculate
+    for cells in filter_stack[-1].iter_dsets():
+        check_cancelled()
+        
+        temp_data_array = np.zeros((cells.npoints, len(fields)))
+        if cells.npoints > 0:
+            for i, (field, index) in enumerate(zip(fields, indices)):
+                fill_cell_data(temp_data_array[:, i], field, index, cells)
         
-        if mass_weighted:
-            weights_list.append(cells.get_sizes()**ndim * cells['rho'])
+        field_weights = get_cell_weights(cells, ndim, weighting)
+        if weighting == 'mass':
+            rho_weights = get_cell_weights(cells, ndim, 'volume')
         else:
-            weights_list.append(cells.get_sizes()**ndim)
+            rho_weights = field_weights
+        weights_list = [rho_weights if field.name == 'rho' else
+                        field_weights for field in fields]
         
         cells = None
+        
+        yield temp_data_array, weights_list
     
     step.data_set = None
+
+
+def iter_sphere_cell_data(field, index, centre, radius,
+                          data_limits, step, shared):
+    """
+    Iterate over cell data within a sphere (centre and radius in box units),
+    filtering with any non-position data_limits. Yields (data_array, radii,
+    volumes, masses) one chunk of cells at a time, in code units. Only the
+    cells in the sphere are read, through a region filter.
+    """
+
+    ndim = shared.ndim
+
+    # If we are going to filter on a field, we need it!
+    field_list = create_field_list(
+        [field] + [limit['field'] for limit in data_limits])
+    if not 'rho' in field_list:
+        field_list.append('rho')
+
+    # Load data, running through sphere filter and then creating point dataset
+    amr = step.data_set.amr_source(field_list)
+    region = pymses.utils.regions.Sphere(centre, radius)
+    amr_region = pymses.filters.RegionFilter(region, amr)
+    cell_source = pymses.filters.CellsToPoints(amr_region)
+
+    # Now, construct function filter stack
+    filter_stack = function_filter_stack(cell_source, data_limits)
+
+    for cells in filter_stack[-1].iter_dsets():
+        check_cancelled()
+
+        # The region filter works on whole octs; trim to the sphere
+        radii = np.sqrt(((cells.points - centre)**2).sum(axis=1))
+        inside = (radii <= radius)
+
+        temp_data_array = np.zeros((cells.npoints))
+        if cells.npoints > 0:
+            fill_cell_data(temp_data_array, field, index, cells)
+        volumes = cells.get_sizes()**ndim
+        masses = volumes * cells['rho']
+
+        cells = None
+
+        yield (temp_data_array[inside], radii[inside],
+               volumes[inside], masses[inside])
+
+    step.data_set = None
+
+
+def find_density_maximum(data_limits, step, shared):
+    """
+    Find the position (in box units) of the densest cell, filtering with
+    any non-position data_limits
+    """
+
+    field_list = create_field_list([limit['field'] for limit in data_limits])
+    if not 'rho' in field_list:
+        field_list.append('rho')
+
+    amr = step.data_set.amr_source(field_list)
+    cell_source = pymses.filters.CellsToPoints(amr)
+    filter_stack = function_filter_stack(cell_source, data_limits)
+
+    rho_max = -np.inf
+    centre = None
+    for cells in filter_stack[-1].iter_dsets():
+        check_cancelled()
+        if cells.npoints == 0:
+            continue
+        i = np.argmax(cells['rho'])
+        if cells['rho'][i] > rho_max:
+            rho_max = cells['rho'][i]
+            centre = np.array(cells.points[i])
+        cells = None
+
+    if centre is None:
+        raise ValueError('No cells found!')
+
+    return centre
+
+
+def fill_cell_data(data_view, field, index, cells):
+    """
+    Fill data_view with the values of a field for a set of cells
+    """
+    if field.extra is not None:
+        data_view[:] = extract_cell_func(field, cells)()
+    elif field.name == 'position':
+        data_view[:] = cells.points[:, index]
+    else:
+        scalar = (cells[field.name].ndim == 1)
+        if scalar:
+            data_view[:] = cells[field.name]
+        else:
+            data_view[:] = cells[field.name][:, index]
+
+
+def get_cell_data(x_field, x_index, y_field, y_index,
+                  data_limits, step, shared):
+    """
+    Obtain cell data for x_axis and y_axis, filtering with data_limits
+    """
+    data_array_list = []
+    weights_list = []
+    
+    for temp_data_array, weights in iter_cell_data(
+            x_field, x_index, y_field, y_index, data_limits, step, shared):
+        data_array_list.append(temp_data_array)
+        weights_list.append(weights)
     
     if x_field is None or y_field is None:
         data_array = np.concatenate(data_array_list)
@@ -577,6 +763,7 @@ def get_sample_data(x_field, x_index, xlim,
                                        z_points)).reshape(3,-1).T
     
     # Load data, then creating point dataset
+    check_cancelled()
     amr = step.data_set.amr_source(field_list)
     
     # Calculate sampled points
@@ -695,6 +882,8 @@ def get_sample_data(x_field, x_index, xlim,
             else:
                 data_array[mask] = float('nan')
     
+    # Sample points are evenly spaced, so each stands for the same volume;
+    # cells are not counted one by one, so 'count' acts as 'volume' here
     if mass_weighted:
         weights = sampled_dset['rho']
     else:
@@ -703,6 +892,53 @@ def get_sample_data(x_field, x_index, xlim,
     return data_array, weights, (bins_x, bins_y)
 
 
+def get_sample_vector_data(field, resolution, density_weighted,
+                           step, shared):
+    """
+    Sample all components of a vector field on a uniform grid covering the
+    whole box. Returns an (npoints, ndim) array, with points ordered so that
+    reshaping to (resolution,)*ndim gives array axis i along coordinate i,
+    and the sampled density if density_weighted (otherwise None).
+    """
+    if field.extra is not None:
+        raise ValueError('Cannot sample extra quantities as vectors!')
+    if 'vector' not in field.flags:
+        raise ValueError('{} is not a vector field!'.format(field.name))
+    
+    field_list = [field.name]
+    if density_weighted and field.name != 'rho':
+        field_list.append('rho')
+    
+    coarse_res, fine_res = get_minmax_res(step.data_set)
+    if resolution > fine_res:
+        raise ValueError('Asking for more resolution than exists!')
+    
+    one_d_points = (np.linspace(0.5, resolution-0.5, resolution) /
+                    resolution)
+    grids = np.meshgrid(*([one_d_points] * shared.ndim), indexing='ij')
+    points = np.vstack([x.ravel() for x in grids]).T
+    grids = None
+    
+    # Load data, then creating point dataset
+    check_cancelled()
+    amr = step.data_set.amr_source(field_list)
+    sampled_dset = pymses.analysis.sample_points(amr, points,
+                                                 add_cell_center=True)
+    points = None
+    
+    # Clean up some memory
+    step.data_set = None
+    gc.collect()
+    
+    vector_array = sampled_dset[field.name]
+    if density_weighted:
+        rho = sampled_dset['rho']
+    else:
+        rho = None
+    
+    return vector_array, rho
+
+
 def get_grid_data(x_field, x_index, xlim, y_field, y_index, ylim, zlim,
                   render_field, render_index, render_fac, render_transform,
                   vector_field, vector_fac, data_limits,
@@ -770,13 +1006,12 @@ def get_grid_data(x_field, x_index, xlim, y_field, y_index, ylim, zlim,
     else:
         render_scalar = False
     if render_field.extra is not None:
-        render_func = extract_data_func(render_field)
+        render_func = extract_data_func(render_field, render_fac)
         if render_transform is None:
-            render_op = ScalarOperator(
-                lambda dset: render_func(dset) * render_fac)
+            render_op = ScalarOperator(render_func)
         else:
             render_op = ScalarOperator(
-                lambda dset: render_transform[0](render_func(dset)*render_fac))
+                lambda dset: render_transform[0](render_func(dset)))
     else:
         if render_fac != 1.0:
             if render_scalar:
@@ -814,6 +1049,7 @@ def get_grid_data(x_field, x_index, xlim, y_field, y_index, ylim, zlim,
                         lambda dset: render_transform[0](
                             dset[render_field.name][..., render_index]))
     
+    check_cancelled()
     if proj:
         # Raytraced integrated plot
         cam = Camera(center=box_centre, line_of_sight_axis=z_axis_name,
@@ -939,65 +1175,63 @@ def function_filter_stack(source, data_limits):
     return filter_stack
 
 
+def get_extra_memo(dset):
+    """
+    Memo of extra quantity results for a dataset, kept for as long as the
+    dataset itself, so that quantities sharing operations reuse them
+    """
+    memo = getattr(dset, 'extra_memo', None)
+    if memo is None:
+        memo = {}
+        try:
+            dset.extra_memo = memo
+        except AttributeError:
+            pass
+    return memo
+
+
+def get_dset_value(dset, field_tuple):
+    """
+    Data of one datafile field (name, index, width) from a dataset
+    """
+    name, index, width = field_tuple
+    if name=='position':
+        return dset.points[:, index]
+    elif width==1:
+        return dset[name]
+    else:
+        return dset[name][..., index]
+
+
 def extract_cell_func(field, cells):
     """
     Extract cell data for extra quantities
     """
     from . import extra_quantities
-    from . import python_math_parser
+    import functools
     
     # cell.points is position data
     # cell[field][:[,1:vec]] is field data
     
-    lookup_table = []
-    parsed = field.extra
-    field_tuples = extra_quantities.get_field_tuples(parsed)
-    for name, index, width in field_tuples:
-        parse_string = str((name, index, width))
-        if name=='position':
-            parse_value = cells.points[:, index]
-        else:
-            #scalar = (cells[name].ndim == 1)
-            if width==1:
-                parse_value = cells[name]
-            else:
-                parse_value = cells[name][:, index]
-        lookup_table.append((parse_string, parse_value))
+    return functools.partial(
+        extra_quantities.calc_extra, field,
+        functools.partial(get_dset_value, cells), get_extra_memo(cells))
 
-    return python_math_parser.gen_calc(parsed, lookup_table)
 
-
-def extract_data_func(field):
+def extract_data_func(field, factor=None):
     """
-    Extract data for extra quantities
+    Extract data for extra quantities, as a function of a dataset; any
+    constant factor (e.g. units) is folded into the compiled expression
     """
     from . import extra_quantities
-    from . import python_math_parser
-    
-    # cell.points is position data
-    # cell[field][:[,1:vec]] is field data
+    import functools
     
-    #lambda dset: dset[render_field_name] * render_fac)
-    
-    lookup_table = []
-    parsed = field.extra
-    field_tuples = extra_quantities.get_field_tuples(parsed)
-    for name, index, width in field_tuples:
-        parse_string = str((name, index, width))
-        if name=='position':
-            def parse_value(dset, index=index):
-                return dset.points[:, index]
-        else:
-            #scalar = (cells[name].ndim == 1)
-            if width==1:
-                def parse_value(dset, name=name):
-                    return dset[name]
-            else:
-                def parse_value(dset, name=name):
-                    return dset[name][..., index]
-        lookup_table.append((parse_string, parse_value))
+    def data_func(dset):
+        return extra_quantities.calc_extra(
+            field, functools.partial(get_dset_value, dset),
+            get_extra_memo(dset), factor)
 
-    return python_math_parser.gen_calc(parsed, lookup_table)
+    return data_func
 
 
 def add_subtract_unit(a, b):
@@ -1064,17 +1298,14 @@ def calc_units_mks(shared, field):
                         '/': (lambda x, y: divide_unit(x, y)),
                         '^': (lambda x, y: x**y)}
 
-    lookup_table = []
-    parsed = field.extra
+    parsed = field.extra_expanded
     field_tuples = extra_quantities.get_field_tuples(parsed)
-    for name, index, width in field_tuples:
-        parse_string = str((name, index, width))
-        parse_value = get_code_units_guess(shared.sim_step_list[0].units, name)
-        lookup_table.append((parse_string, parse_value))
-
-    mks = python_math_parser.gen_calc(
-        parsed, lookup_table, unary_dict=unit_unary_dict,
-        binary_dict=unit_binary_dict)()
+    units = [get_code_units_guess(shared.sim_step_list[0].units, name)
+             for name, index, width in field_tuples]
+
+    mks = python_math_parser.compile_calc(
+        parsed, [str(field_tuple) for field_tuple in field_tuples],
+        unary_dict=unit_unary_dict, binary_dict=unit_binary_dict)(*units)
     if shared.config.get_safe('data', 'use_units') == 'off':
         field.code_mks = 1.0
     elif hasattr(mks, 'val'):
@@ -32,6 +32,29 @@ elif qt_library == 'pyside':
     print('Using PySide')
     from PySide import QtCore, QtGui
 
+# Signals are named differently in PyQt and PySide
+try:
+    Signal = QtCore.pyqtSignal
+except AttributeError:
+    Signal = QtCore.Signal
+
+class GuiCall(QtCore.QObject):
+    """
+    Relay function calls from other threads to the GUI thread
+    """
+    called = Signal(object)
+    
+    def __init__(self):
+        QtCore.QObject.__init__(self)
+        self.called.connect(self.run)
+    
+    def run(self, call):
+        """
+        Make the call, in the GUI thread
+        """
+        func, args = call
+        func(*args)
+
 class BackendQT4(BackendMPL):
     """
     Backend for interactive QT4 use
@@ -56,6 +79,11 @@ class BackendQT4(BackendMPL):
             self.app = QtGui.QApplication([])
         self.figure_exists = False
         self.window_active = False
+        self.event_loop = None
+        
+        # Data for plot updates is loaded in a background thread
+        self.gui_call = GuiCall()
+        self.loader = None
         
         self.plot_args = {}
         
@@ -70,6 +98,11 @@ class BackendQT4(BackendMPL):
         
         self.zoom_factor = 1
         self.zoom_mult = 1
+        
+        # Keep the artists of image plots between updates of the same window,
+        # showing render maps reduced to the window size
+        self.reuse_figure = True
+        self.use_mipmaps = True
     
     def on_exit(self):
         """
@@ -82,10 +115,15 @@ class BackendQT4(BackendMPL):
         
     def interactive_loop(self):
         """
-        The QT interactive loop. Process events until the window is closed.
+        The QT interactive loop. Block in a local event loop, sleeping until
+        there are events, until the window is closed.
         """
-        while self.window_active:
-            self.app.processEvents()
+        self.event_loop = QtCore.QEventLoop()
+        try:
+            if self.window_active:
+                self.event_loop.exec_()
+        finally:
+            self.event_loop = None
     
     def init_figure(self):
         """
@@ -93,7 +131,10 @@ class BackendQT4(BackendMPL):
         """
         self.fig = self.Figure()
         self.canvas = self.FigureCanvas(self.fig)
+        self.figure_key = None
+        self.figure_artists = None
         self.fig.canvas.mpl_connect('key_press_event', self.key_press_pass)
+        self.fig.canvas.mpl_connect('resize_event', self.resize_pass)
         self.canvas.setFocusPolicy(QtCore.Qt.StrongFocus)
         self.canvas.setFocus()
         
@@ -102,6 +143,30 @@ class BackendQT4(BackendMPL):
         self.win.setCentralWidget(self.canvas)
         self.win.setAttribute(QtCore.Qt.WA_DeleteOnClose)
 
+    def call_in_gui(self, func, *args):
+        """
+        Call func(*args) in the GUI thread; may be used from any thread
+        """
+        self.gui_call.called.emit((func, args))
+    
+    def set_busy(self, busy):
+        """
+        Show a busy cursor while data is loaded in the background
+        """
+        if busy:
+            self.app.setOverrideCursor(QtCore.Qt.BusyCursor)
+        else:
+            self.app.restoreOverrideCursor()
+    
+    def resize_pass(self, event):
+        """
+        Show the level of a rendered map matching the new window size
+        """
+        if (self.figure_artists is not None and
+                self.plot_options['plot_type'] == 'render'):
+            if self.show_render_level():
+                self.canvas.draw_idle()
+    
     def key_press_pass(self, event):
         """
         Pass backend and keys to 'key_press_event' function
@@ -133,10 +198,26 @@ class BackendQT4(BackendMPL):
 
     def update_plot(self):
         """
-        Data has been updated; replot figure
+        Data has been updated; replot figure, updating the artists in place
+        if the figure layout is unchanged, else clearing and rebuilding it
         """
-        self.fig.clf()
         self.plot_data()
+    
+    def blit_images(self):
+        """
+        Redraw the image and colourbar axes over the last full draw, and
+        blit them to the window; for changes of the colour map only
+        """
+        for ax in (self.main_axes, self.cbar_axes):
+            if ax is None:
+                continue
+            artists = (list(ax.images) + list(ax.collections) +
+                       list(ax.patches) + list(ax.lines) + list(ax.texts) +
+                       list(ax.spines.values()))
+            for artist in sorted(artists, key=lambda a: a.get_zorder()):
+                if artist.get_visible():
+                    ax.draw_artist(artist)
+            self.canvas.blit(ax.bbox)
         
     def close_plot(self, *args):
         """
@@ -148,12 +229,16 @@ class BackendQT4(BackendMPL):
         """
         Close the output canvas
         """
+        if self.loader is not None:
+            self.loader.cancel()
         if event:
             event.accept()
             self.win.close()
         else:
             self.win.close()
         self.window_active = False
+        if self.event_loop is not None:
+            self.event_loop.quit()
 
     def output_canvas(self):
         """
@@ -161,6 +246,15 @@ class BackendQT4(BackendMPL):
         """
         from matplotlib.widgets import SpanSelector, RectangleSelector
         
+        if self.window_active and self.figure_updated is not None:
+            # Same figure: keep the zoom selectors, redraw what changed
+            if (self.figure_updated == 'style' and
+                    getattr(self.canvas, 'supports_blit', False)):
+                self.blit_images()
+            else:
+                self.canvas.draw_idle()
+            return
+        
         rectprops = dict(edgecolor = 'black', linewidth=1.5, fill=False)
         self.main_zoom = RectangleSelector(
             self.main_axes, self.onselect_main, button=1, drawtype='box',
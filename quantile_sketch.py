@@ -0,0 +1,134 @@
+"""
+This submodule implements a mergeable, weighted quantile sketch (a merging
+t-digest), which can be fed data one chunk at a time in bounded memory.
+"""
+
+from __future__ import print_function
+import numpy as np
+
+
+class TDigest():
+    """
+    Weighted quantile sketch. Data is summarised by a sorted set of centroids
+    (mean, weight); centroids are small near the tails and large near the
+    median, so that extreme quantiles remain accurate. The number of
+    centroids is roughly compression/2, whatever the amount of data fed in.
+    """
+    def __init__(self, compression=500):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.count = 0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def __repr__(self):
+        return 'TDigest({}, {} centroids, {} values)'.format(
+            self.compression, self.means.size, self.count)
+
+    @property
+    def total_weight(self):
+        return self.weights.sum()
+
+    def update(self, values, weights=None):
+        """
+        Add a chunk of values (with optional weights) to the sketch.
+        Non-finite values and values with non-positive weight are ignored.
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if weights is None:
+            weights = np.ones_like(values)
+        else:
+            weights = np.asarray(weights, dtype=np.float64).ravel()
+        if values.shape != weights.shape:
+            raise ValueError('Values and weights have different shapes!')
+
+        valid = np.isfinite(values)
+        valid &= (weights > 0.0)
+        if not valid.all():
+            values = values[valid]
+            weights = weights[valid]
+        if values.size == 0:
+            return
+
+        self.count += values.size
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.compress(values, weights)
+
+    def merge(self, other):
+        """
+        Merge another sketch into this one
+        """
+        if other.count == 0:
+            return
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.compress(other.means, other.weights)
+
+    def compress(self, means, weights):
+        """
+        Combine new (mean, weight) points with the existing centroids, and
+        group them so that each centroid spans at most one unit of the
+        arcsine scale function k(q) = compression/(2 pi) * asin(2q - 1)
+        """
+        means = np.concatenate((self.means, means))
+        weights = np.concatenate((self.weights, weights))
+
+        order = np.argsort(means, kind='mergesort')
+        means = means[order]
+        weights = weights[order]
+
+        cum_weight = np.cumsum(weights)
+        total = cum_weight[-1]
+        q_mid = (cum_weight - 0.5 * weights) / total
+        np.clip(q_mid, 0.0, 1.0, out=q_mid)
+        k = (self.compression / (2.0 * np.pi)) * np.arcsin(2.0 * q_mid - 1.0)
+        group = np.floor(k - k[0]).astype(np.intp)
+
+        group_weight = np.bincount(group, weights=weights)
+        group_sum = np.bincount(group, weights=weights * means)
+        filled = group_weight > 0.0
+
+        self.weights = group_weight[filled]
+        self.means = group_sum[filled] / self.weights
+
+    def quantile(self, q):
+        """
+        Estimate the weighted quantile(s) q (0 <= q <= 1)
+        """
+        if self.count == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+
+        cum_weight = np.cumsum(self.weights)
+        total = cum_weight[-1]
+        q_centroid = (cum_weight - 0.5 * self.weights) / total
+
+        q_points = np.concatenate(([0.0], q_centroid, [1.0]))
+        x_points = np.concatenate(([self.min], self.means, [self.max]))
+
+        return np.interp(q, q_points, x_points)
+
+    def percentile(self, p):
+        """
+        Estimate the weighted percentile(s) p (0 <= p <= 100)
+        """
+        return self.quantile(np.asarray(p) / 100.0)
+
+
+def sketch_array(data_array, weights=None, block_size=2**20,
+                 compression=500):
+    """
+    Build a TDigest from a (possibly large) array, one block at a time
+    """
+    sketch = TDigest(compression)
+    n = len(data_array)
+    for start in range(0, n, block_size):
+        if weights is None:
+            block_weights = None
+        else:
+            block_weights = weights[start:start+block_size]
+        sketch.update(data_array[start:start+block_size], block_weights)
+
+    return sketch
@@ -65,24 +65,23 @@ class BackendStream():
             self.data_array = self.data_list[0]
         
         elif plot_type == 'hist2d':
-            xedges, yedges, counts, min_max_data = self.data_list
+            xedges, yedges, counts, min_max_data = self.data_list[:4]
             
-            self.data_array = np.empty((len(xedges)*len(yedges), 3))
-            
-            k = 0
-            for i in range(len(xedges)-1):
-                for j in range(len(xedges)-1):
-                    x_cen = 0.5*(xedges[i] + xedges[i+1])
-                    y_cen = 0.5*(yedges[i] + yedges[i+1])
-                    self.data_array[k, :] = [x_cen, y_cen, counts[i,j]]
-                    k = k + 1
+            # One row per bin: x centre, y centre, value (x-major, as
+            # counts is indexed [x, y])
+            x_cen = 0.5 * (xedges[:-1] + xedges[1:])
+            y_cen = 0.5 * (yedges[:-1] + yedges[1:])
+            x_grid, y_grid = np.meshgrid(x_cen, y_cen, indexing='ij')
+            self.data_array = np.column_stack(
+                (x_grid.ravel(), y_grid.ravel(), np.ravel(counts)))
         
         elif plot_type == 'render':
             
-            nxy = self.data_list[0].shape
-            if len(nxy) != 2:
+            grid_data = self.data_list[0]
+            if grid_data.ndim != 2:
                 raise ValueError("Didn't do non-3D stuff!")
-            nx, ny = nxy
+            # Image rows are y, columns are x
+            ny, nx = grid_data.shape
             
             half_dx = 0.5 * (xmax - xmin) / float(nx)
             half_dy = 0.5 * (ymax - ymin) / float(ny)
@@ -90,14 +89,10 @@ class BackendStream():
             x_pos = np.linspace(xmin + half_dx, xmax - half_dx, nx)
             y_pos = np.linspace(ymin + half_dy, ymax - half_dy, ny)
             
-            self.data_array = np.empty((nx * ny, 3))
-            
-            k = 0
-            for i, x in enumerate(x_pos):
-                for j, y in enumerate(y_pos):
-                    self.data_array[k,:] = [x_pos[i], y_pos[i],
-                                            self.data_list[0][i, j]]
-                    k = k + 1
+            # One row per pixel: x, y, value (y-major, as grid_data)
+            y_grid, x_grid = np.meshgrid(y_pos, x_pos, indexing='ij')
+            self.data_array = np.column_stack(
+                (x_grid.ravel(), y_grid.ravel(), grid_data.ravel()))
         else:
             # Single axis plots
             
@@ -119,10 +114,9 @@ class BackendStream():
                 if qy_transform is not None:
                     counts = qy_transform[0](counts)
                 
-                self.data_array = np.empty((len(bins), 2))
-                for i, x in enumerate(bins[:-1]):
-                    self.data_array[i, :] = [bins[i], counts[i]]
-                self.data_array[-1, :] = (bins[-1], 0.0)
+                # Left bin edges and counts, closed by the right edge
+                self.data_array = np.column_stack(
+                    (bins, np.append(counts, 0.0)))
         
             elif plot_type.properties['plot_type'] == 'power_spectrum':
                 
@@ -135,7 +129,30 @@ class BackendStream():
                 if qy_transform is not None:
                     y = qy_transform[0](y)
                 
-                self.data_array = np.vstack((x,y)).T
+                columns = [x, y]
+                if 'extra_lines' in extra_info:
+                    # extra lines share the same x values
+                    for x_line, y_line, label in extra_info['extra_lines']:
+                        if qy_transform is not None:
+                            y_line = qy_transform[0](y_line)
+                        columns.append(y_line)
+                
+                self.data_array = np.vstack(columns).T
+            
+            elif plot_type.properties['plot_type'] == 'radial_profile':
+                
+                r, mean, extra_info = self.data_list
+                r_outer = extra_info['r_edges'][1:]
+                
+                if qx_transform is not None:
+                    r = qx_transform[0](r)
+                    r_outer = qx_transform[0](r_outer)
+                
+                # Columns: bin centre, mean, dispersion, bin outer edge,
+                # enclosed mass
+                self.data_array = np.vstack(
+                    [r, mean, extra_info['dispersion'], r_outer,
+                     extra_info['enclosed_mass']]).T
                 
         # Write figure to file
         self.output_canvas()
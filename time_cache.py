@@ -0,0 +1,96 @@
+"""
+This submodule implements an on-disk cache of time plot results, so that
+each output is only reduced once for a given field, operation and settings.
+"""
+
+from __future__ import print_function
+import os
+import json
+
+cache_filename = 'splosh.timecache'
+
+# Number of new entries between writes of the cache file
+save_interval = 100
+
+
+class TimeSeriesCache():
+    """
+    Cache of (time, value) results of reducing one output to a single value,
+    stored as JSON in the current directory. Entries are keyed by the output
+    directory and its modification time, so rewritten outputs are redone.
+    """
+    def __init__(self, shared):
+        self.filename = os.path.join(shared.cwd, cache_filename)
+        self.entries = {}
+        self.unsaved = 0
+        self.load()
+
+    def __repr__(self):
+        return 'TimeSeriesCache({}, {} entries)'.format(self.filename,
+                                                        len(self.entries))
+
+    def load(self):
+        """
+        Read the cache file, if there is a readable one
+        """
+        if not os.path.isfile(self.filename):
+            return
+        try:
+            with open(self.filename, 'r') as f:
+                self.entries = json.load(f)
+        except (IOError, ValueError):
+            print('Warning - could not read time plot cache {}'.format(
+                self.filename))
+            self.entries = {}
+
+    def save(self):
+        """
+        Write the cache file, replacing any old one only once it is complete
+        """
+        temp_filename = self.filename + '.tmp'
+        try:
+            with open(temp_filename, 'w') as f:
+                json.dump(self.entries, f)
+            if os.path.exists(self.filename):
+                os.remove(self.filename)
+            os.rename(temp_filename, self.filename)
+            self.unsaved = 0
+        except (IOError, OSError):
+            print('Warning - could not write time plot cache {}'.format(
+                self.filename))
+
+    def get(self, key):
+        """
+        Cached (time, value) for a key, or None
+        """
+        return self.entries.get(key)
+
+    def set(self, key, time, value):
+        """
+        Store (time, value) for a key, writing the cache file every
+        save_interval new entries
+        """
+        self.entries[key] = [float(time), float(value)]
+        self.unsaved += 1
+        if self.unsaved >= save_interval:
+            self.save()
+
+    def flush(self):
+        """
+        Write the cache file, if there are new entries
+        """
+        if self.unsaved > 0:
+            self.save()
+
+
+def get_time_key(step, settings):
+    """
+    Cache key for one output: the output directory, its modification time,
+    and the settings (field, operation, units etc.) which give the result
+    """
+    from . import wrapper_functions as wf
+
+    output_dir = os.path.abspath(step.output_dir)
+    mtime = wf.get_output_mtime(step.output_dir)
+
+    return json.dumps([output_dir, mtime] + list(settings))
@@ -4,7 +4,7 @@ This submodule implements transforms, including the transforms submenu
 
 from __future__ import print_function
 import numpy as np
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
 
 # input and xrange, Python 3 style
 try:
@@ -14,15 +14,69 @@ except NameError:
     pass
 
 
+class Transform(namedtuple('Transform', ['forward', 'inverse', 'domain',
+                                           'inverse_domain'])):
+    """
+    Pair of float ufuncs (forward and inverse, both accepting out= for
+    in-place use), with the names of the domains on which each is valid
+    """
+    __slots__ = ()
+
+
+def ten_to(x, out=None):
+    """
+    Inverse of log10, as a float ufunc call
+    """
+    return np.power(10.0, x, out=out)
+
+
+def in_domain(domain, values):
+    """
+    Boolean mask of values within the named domain
+    """
+    if domain == 'positive':
+        return values > 0.0
+    elif domain == 'nonnegative':
+        return values >= 0.0
+    elif domain == 'nonzero':
+        return values != 0.0
+    return np.ones(np.shape(values), dtype=bool)
+
+
+def apply_transform(transform, values, inverse=False, out=None):
+    """
+    Apply a transform (or its inverse) to values, giving NaN rather than
+    warnings or infinities outside its domain; out=values works in place
+    """
+    if transform is None:
+        return values
+    if inverse:
+        func, domain = transform.inverse, transform.inverse_domain
+    else:
+        func, domain = transform.forward, transform.domain
+    values = np.asarray(values, dtype=float)
+    if domain == 'all':
+        return func(values, out=out)
+    mask = in_domain(domain, values)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = func(values, out=out)
+    if result.ndim == 0:
+        return result if mask else np.nan
+    result[~mask] = np.nan
+    return result
+
+
 def get_transform_dict():
-    ten_to = np.frompyfunc(lambda x: 10.0**x, 1, 1)
-    transform_dict = OrderedDict([('none', None),
-                                  ('log(x)', (np.log10, ten_to)),
-                                  ('ln(x)', (np.log, np.exp)),
-                                  ('|x|', (np.fabs, np.array)),
-                                  ('1/x', (np.reciprocal, np.reciprocal)),
-                                  ('sqrt(x)', (np.sqrt, np.square)),
-                                  ('x^2', (np.square, np.sqrt))])
+    transform_dict = OrderedDict([
+        ('none', None),
+        ('log(x)', Transform(np.log10, ten_to, 'positive', 'all')),
+        ('ln(x)', Transform(np.log, np.exp, 'positive', 'all')),
+        ('|x|', Transform(np.fabs, np.positive, 'all', 'nonnegative')),
+        ('1/x', Transform(np.reciprocal, np.reciprocal, 'nonzero',
+                          'nonzero')),
+        ('sqrt(x)', Transform(np.sqrt, np.square, 'nonnegative',
+                              'nonnegative')),
+        ('x^2', Transform(np.square, np.sqrt, 'all', 'nonnegative'))])
     return transform_dict
 
 
@@ -25,4 +25,21 @@ class BackendTXT(BackendStream):
         filename = self.output_filename + self.extension
         print('Writing to file {}...'.format(filename))
         with open(filename, 'wt') as f:
-            np.savetxt(f, self.data_array)
+            write_table(f, self.data_array)
+
+
+def write_table(f, data_array, fmt='%.18e', block_rows=2**16):
+    """
+    Write a 2D array to an open text file, as np.savetxt would, formatting
+    one block of rows with a single string operation rather than row by row
+    """
+    import numpy as np
+    
+    data_array = np.asarray(data_array)
+    if data_array.ndim == 1:
+        data_array = data_array[:, np.newaxis]
+    row_fmt = ' '.join([fmt] * data_array.shape[1]) + '\n'
+    
+    for start in range(0, data_array.shape[0], block_rows):
+        block = data_array[start:start+block_rows]
+        f.write((row_fmt * block.shape[0]) % tuple(block.ravel()))